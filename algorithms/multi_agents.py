@@ -4,14 +4,33 @@
 
 import random
 import math
+import time
 import sys
 import os
+from contextlib import contextmanager
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core import util
+from core import ghostAgents
 from core.game import Agent
+from core.game import Directions
+from core.layout import Layout
+from core.pacman import GameState
+from core.pacman import (
+    TIME_PENALTY,
+    FOOD_SCORE,
+    GHOST_SCORE,
+    WIN_SCORE,
+    LOSE_PENALTY,
+)
+from algorithms.transposition import (
+    TranspositionTable,
+    EXACT,
+    LOWERBOUND,
+    UPPERBOUND,
+)
 
 
 class ReflexAgent(Agent):
@@ -133,6 +152,20 @@ def scoreEvaluationFunction(currentGameState):
     return currentGameState.getScore()
 
 
+def parseFlag(value):
+    """
+    Reads a boolean agent option, which arrives as a string (or 1 when given
+    on the command line with no value).
+    """
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when the per-move time budget runs out.
+    """
+
+
 class MultiAgentSearchAgent(Agent):
     """
     This class provides some common elements to all of your
@@ -143,15 +176,354 @@ class MultiAgentSearchAgent(Agent):
     add functionality to all your adversarial search agents.  Please do not
     remove anything, however.
 
+    Setting ttSize to a positive number gives the agent a transposition table
+    (transposition.py) holding that many positions, kept across moves.
+    ttPolicy chooses how it makes room when full: "lru" or "depth".
+
+    Setting timeBudgetMs to a positive number turns on anytime play: the agent
+    searches depth 1, 2, 3, ... until the budget for the move is spent and
+    plays the best move of the last iteration that finished.  depth is then
+    ignored.  Each iteration tries the previous iteration's principal
+    variation first, which makes alpha-beta prune much more.
+
+    Setting makeUnmake walks the tree by applying and undoing moves on a
+    single GameState (GameState.applyAction) instead of allocating a
+    successor state for every node.
+
+    A ghost with a single legal move (in a corridor, ghosts cannot turn back)
+    is moved straight on without the bookkeeping of a search node: no move
+    ordering and no transposition table lookup or store.  Set forcedMoves to
+    False to search those plies like any other.
+
+    Setting groupGhosts (minimizing ghosts only) searches the moves of
+    interchangeable ghosts, those that stand on the same cell facing the same
+    way with the same scared timer, as unordered combinations: the later
+    ghost of a pair never moves earlier in the legal action order than the
+    earlier one did this round, since swapping their moves only swaps the
+    ghosts.  This assumes the evaluation function treats all ghosts alike.
+
+    Evaluation functions listed in BATCH_EVALUATIONS score leaves in batches:
+    the leaves below a last ghost's chance or min node are scored in one
+    call, and the work they share (food and capsule distances) is kept for
+    the rest of the move.  Alpha-beta and Star1/Star2 hand their leaves over
+    one at a time, so that a cutoff still skips the siblings left.  Set batchLeaves to
+    False to call evalFn on every leaf instead.
+
     Note: this is an abstract class: one that should not be instantiated.  It's
     only partially specified, and designed to be extended.  Agent (game.py)
     is another abstract class.
     """
 
-    def __init__(self, evalFn="scoreEvaluationFunction", depth="2"):
+    # Deepest iteration of an anytime search
+    MAX_SEARCH_DEPTH = 100
+
+    # Nodes searched between two looks at the clock
+    CLOCK_CHECK_INTERVAL = 64
+
+    def __init__(
+        self,
+        evalFn="scoreEvaluationFunction",
+        depth="2",
+        ttSize="0",
+        ttPolicy="lru",
+        timeBudgetMs="0",
+        makeUnmake="False",
+        forcedMoves="True",
+        groupGhosts="False",
+        batchLeaves="True",
+    ):
         self.index = 0  # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        self.transpositionTable = None
+        if int(ttSize) > 0:
+            self.transpositionTable = TranspositionTable(int(ttSize), ttPolicy)
+        self.timeBudget = float(timeBudgetMs) / 1000.0
+        self.makeUnmake = parseFlag(makeUnmake)
+        self.forcedMoves = parseFlag(forcedMoves)
+        self.groupGhosts = parseFlag(groupGhosts)
+        self.batchEvaluation = None
+        if parseFlag(batchLeaves):
+            self.batchEvaluation = BATCH_EVALUATIONS.get(
+                self.evaluationFunction.__name__
+            )
+        self.leafFeatures = {}
+
+        # Search bookkeeping, reset on every move
+        self.searchDepth = self.depth
+        self.deadline = None
+        self.nodesExpanded = 0
+        self.principalVariation = []
+        self.pvLines = {}
+        self.completedDepth = 0
+        # (ghostKey, action) of each ghost's move on the current line this round
+        self.ghostRound = {}
+
+    def search(self, gameState):
+        """
+        Searches gameState to self.searchDepth and returns a (value, action)
+        pair.  Implemented by each search agent.
+        """
+        util.raiseNotDefined()
+
+    def chooseAction(self, gameState):
+        """
+        Returns the action picked by a fixed-depth search, or by an anytime
+        search if a time budget is set.
+        """
+        self.nodesExpanded = 0
+        self.pvLines = {}
+        self.leafFeatures = {}
+        if self.timeBudget > 0:
+            return self.iterativeDeepening(gameState)
+
+        self.searchDepth = self.depth
+        self.deadline = None
+        self.principalVariation = []
+        value, action = self.search(gameState)
+        self.completedDepth = self.depth
+        return action
+
+    def iterativeDeepening(self, gameState):
+        """
+        Deepens the search one level at a time until the time budget runs out,
+        returning the best action of the last completed iteration.
+        """
+        startTime = time.time()
+        bestAction = None
+        self.principalVariation = []
+        self.completedDepth = 0
+
+        for searchDepth in range(1, self.MAX_SEARCH_DEPTH + 1):
+            self.searchDepth = searchDepth
+            # The first iteration always finishes so there is a move to play
+            self.deadline = None if bestAction is None else startTime + self.timeBudget
+            try:
+                value, action = self.search(gameState)
+            except SearchTimeout:
+                break
+            bestAction = action
+            self.completedDepth = searchDepth
+            self.principalVariation = self.pvLines.get(0, [action])
+            if time.time() - startTime >= self.timeBudget:
+                break
+
+        self.deadline = None
+        return bestAction
+
+    def visitNode(self):
+        """
+        Counts a searched node and gives up the search if it is out of time.
+        """
+        self.nodesExpanded += 1
+        if (
+            self.deadline is not None
+            and self.nodesExpanded % self.CLOCK_CHECK_INTERVAL == 0
+            and time.time() >= self.deadline
+        ):
+            raise SearchTimeout()
+
+    @contextmanager
+    def successor(self, gameState, agentIndex, action):
+        """
+        Provides the state after agentIndex takes action.  With makeUnmake the
+        move is made on gameState itself and taken back when the block exits,
+        even if the search is abandoned part way.
+        """
+        if self.makeUnmake:
+            undo = gameState.applyAction(agentIndex, action)
+            try:
+                yield gameState
+            finally:
+                gameState.undoAction(undo)
+        else:
+            yield gameState.generateSuccessor(agentIndex, action)
+
+    def evaluateLeaves(self, states):
+        """
+        Returns the evaluations of a list of leaf states.
+        """
+        if self.batchEvaluation is None:
+            return [self.evaluationFunction(state) for state in states]
+        return self.batchEvaluation(states, self.leafFeatures)
+
+    def evaluate(self, gameState):
+        return self.evaluateLeaves([gameState])[0]
+
+    def evaluateChildren(self, gameState, agentIndex, actions):
+        """
+        Returns the evaluations of the states after agentIndex plays each of
+        actions, which must all be leaves, scored as one batch.
+        """
+        states = []
+        for action in actions:
+            self.visitNode()
+            states.append(gameState.generateSuccessor(agentIndex, action))
+        return self.evaluateLeaves(states)
+
+    def isFrontier(self, gameState, agentIndex, depth):
+        """
+        Returns whether every child of this node is a leaf that is worth
+        scoring in a batch.
+        """
+        return (
+            self.batchEvaluation is not None
+            and agentIndex == gameState.getNumAgents() - 1
+            and depth + 1 == self.searchDepth
+        )
+
+    def baseCase(self, gameState, depth):
+        # Base Case - Game is Over or reached max depth
+        # Stop recursion if any is true
+        return (
+            gameState.isWin() or gameState.isLose() or (depth == self.searchDepth)
+        )
+
+    def nextAgent(self, gameState, agentIndex, depth):
+        """
+        Returns the (agentIndex, depth) of the node reached after agentIndex moves.
+        """
+        if agentIndex == gameState.getNumAgents() - 1:
+            # Recursed in All agent. Back to pacman in new depth
+            return 0, depth + 1
+        # Recurse in next ghost
+        return agentIndex + 1, depth
+
+    def getPly(self, gameState, agentIndex, depth):
+        """
+        Returns the number of single-agent moves between the root and this node.
+        """
+        return depth * gameState.getNumAgents() + agentIndex
+
+    def getPVMove(self, gameState, agentIndex, depth):
+        """
+        Returns the previous iteration's principal variation move for this
+        node's ply, or None.
+        """
+        ply = self.getPly(gameState, agentIndex, depth)
+        if ply < len(self.principalVariation):
+            return self.principalVariation[ply]
+        return None
+
+    def orderActions(self, gameState, agentIndex, depth):
+        """
+        Returns the legal actions of agentIndex, trying the previous
+        iteration's principal variation move for this ply first.
+        """
+        actions = gameState.getLegalActions(agentIndex)
+        pvMove = self.getPVMove(gameState, agentIndex, depth)
+        if pvMove is not None and pvMove in actions and pvMove != actions[0]:
+            # The legal actions may be shared, so build a new sequence
+            actions = [pvMove] + [action for action in actions if action != pvMove]
+        return actions
+
+    def forcedMove(self, gameState, agentIndex):
+        """
+        Returns the only legal move of ghost agentIndex, or None if it has a
+        choice or forced moves are searched like the others.
+        """
+        if self.forcedMoves and agentIndex > 0:
+            actions = gameState.getLegalActions(agentIndex)
+            if len(actions) == 1:
+                return actions[0]
+        return None
+
+    def playForcedMove(self, gameState, agentIndex, depth, action, search, *window):
+        """
+        Makes the forced move action and returns (value, action) for
+        gameState, continuing with search(successor, agentIndex, depth,
+        *window) below it.
+        """
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        ply = self.getPly(gameState, agentIndex, depth)
+        # A forced ghost never restricts an interchangeable one
+        self.ghostRound[agentIndex] = (None, action)
+        self.pvLines[ply + 1] = []
+        with self.successor(gameState, agentIndex, action) as successor:
+            value = search(successor, nextIndex, nextDepth, *window)[0]
+        self.pvLines[ply] = [action] + self.pvLines[ply + 1]
+        return value, action
+
+    def ghostKey(self, gameState, agentIndex, depth):
+        """
+        Returns what two ghosts must share to be interchangeable: where they
+        stand and face, how long they stay scared and, if they may be eaten
+        and sent back to their start before the search ends, that start.
+        """
+        ghost = gameState.data.agentStates[agentIndex]
+        start = None
+        if ghost.scaredTimer > 0:
+            start = ghost.start
+        else:
+            # Pacman moves once more per remaining round to reach a capsule
+            reach = self.searchDepth - depth - 1
+            position = gameState.getPacmanPosition()
+            for capsule in gameState.getCapsules():
+                if util.manhattanDistance(position, capsule) <= reach:
+                    start = ghost.start
+                    break
+        return ghost.configuration, ghost.scaredTimer, start
+
+    def groupActions(self, gameState, agentIndex, depth, actions):
+        """
+        Returns (ghostKey, actions) for ghost agentIndex, leaving out the
+        moves that come before the move of an interchangeable ghost that
+        moved earlier this round.
+        """
+        key = self.ghostKey(gameState, agentIndex, depth)
+        legalActions = gameState.getLegalActions(agentIndex)
+        first = 0
+        for index in range(1, agentIndex):
+            otherKey, otherAction = self.ghostRound[index]
+            if otherKey == key:
+                first = max(first, legalActions.index(otherAction))
+        if first > 0:
+            actions = [a for a in actions if legalActions.index(a) >= first]
+        return key, actions
+
+    def isGrouped(self, gameState, agentIndex, depth):
+        """
+        Returns whether groupGhosts may leave moves out below this ghost node
+        this round, which makes its value depend on the moves that led to it
+        and unfit for the transposition table.
+        """
+        if not self.groupGhosts or agentIndex < 2:
+            return False
+        keys = set(self.ghostRound[index][0] for index in range(1, agentIndex))
+        return any(
+            self.ghostKey(gameState, index, depth) in keys
+            for index in range(agentIndex, gameState.getNumAgents())
+        )
+
+    def probeTransposition(self, gameState, agentIndex):
+        """
+        Returns the transposition table entry for this node, however deep it
+        was searched, or None.
+        """
+        if self.transpositionTable is None:
+            return None
+        return self.transpositionTable.lookup((gameState.zobrist(), agentIndex))
+
+    def lookupTransposition(self, gameState, agentIndex, depth):
+        """
+        Returns the transposition table entry for this node if it was searched
+        at least as deep as the current search needs, otherwise None.
+        """
+        entry = self.probeTransposition(gameState, agentIndex)
+        if entry is not None and entry.depth >= self.searchDepth - depth:
+            return entry
+        return None
+
+    def storeTransposition(self, gameState, agentIndex, depth, node, flag):
+        if self.transpositionTable is not None:
+            value, action = node
+            self.transpositionTable.store(
+                (gameState.zobrist(), agentIndex),
+                value,
+                self.searchDepth - depth,
+                flag,
+                action,
+            )
 
 
 class MinimaxAgent(MultiAgentSearchAgent):
@@ -182,183 +554,515 @@ class MinimaxAgent(MultiAgentSearchAgent):
         gameState.isLose():
         Returns whether or not the game state is a losing state
         """
-
-        def baseCase(gameState, depth):
-            # Base Case - Game is Over or reached max depth
-            # Stop recursion if any is true
-            return gameState.isWin() or gameState.isLose() or (depth == self.depth)
-
-        def minimax(gameState, agentIndex, depth):
-            if baseCase(gameState, depth):
-                return self.evaluationFunction(gameState), ""
-
-            elif agentIndex == 0:
-                # Want to maxize Pacman (evalScore the hight the better)
-                node = maxValue(gameState, agentIndex, depth)
+        return self.chooseAction(gameState)
+
+    def search(self, gameState):
+        return self.minimax(gameState, agentIndex=0, depth=0)
+
+    def minimax(self, gameState, agentIndex, depth):
+        self.visitNode()
+        if self.baseCase(gameState, depth):
+            return self.evaluate(gameState), ""
+
+        forced = self.forcedMove(gameState, agentIndex)
+        if forced is not None:
+            return self.playForcedMove(
+                gameState, agentIndex, depth, forced, self.minimax
+            )
+
+        entry = self.lookupTransposition(gameState, agentIndex, depth)
+        if entry is not None:
+            # Minimax values are always exact
+            return entry.value, entry.bestMove
+
+        if agentIndex == 0:
+            # Want to maxize Pacman (evalScore the hight the better)
+            node = self.maxValue(gameState, agentIndex, depth)
+        else:
+            # Minimize the ghosts actions
+            node = self.minValue(gameState, agentIndex, depth)
+        if not self.isGrouped(gameState, agentIndex, depth):
+            self.storeTransposition(gameState, agentIndex, depth, node, EXACT)
+        return node
+
+    def minValue(self, gameState, agentIndex, depth):
+        val = math.inf
+        act = ""
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        ply = self.getPly(gameState, agentIndex, depth)
+        line = []
+
+        actions = self.orderActions(gameState, agentIndex, depth)
+        if self.groupGhosts:
+            key, actions = self.groupActions(
+                gameState, agentIndex, depth, actions
+            )
+        leafValues = None
+        if self.isFrontier(gameState, agentIndex, depth):
+            leafValues = self.evaluateChildren(gameState, agentIndex, actions)
+        for moveNumber, action in enumerate(actions):
+            if self.groupGhosts:
+                self.ghostRound[agentIndex] = (key, action)
+            self.pvLines[ply + 1] = []
+            if leafValues is not None:
+                node = leafValues[moveNumber], ""
             else:
-                # Minimize the ghosts actions
-                node = minValue(gameState, agentIndex, depth)
-            return node
-
-        def minValue(gameState, agentIndex, depth):
-            val = math.inf
-            act = ""
-
-            for action in gameState.getLegalActions(agentIndex):
-                if agentIndex == gameState.getNumAgents() - 1:
-                    # Recursed in All agent. Back to pacman in new depth
-                    node = minimax(
-                        gameState.generateSuccessor(agentIndex, action), 0, depth + 1
-                    )
-                else:
-                    # Recurse in next ghost
-                    node = minimax(
-                        gameState.generateSuccessor(agentIndex, action),
-                        agentIndex + 1,
-                        depth,
-                    )
-
-                # Find action that minimize val
-                if val > node[0]:
-                    val = node[0]
-                    act = action
-            return val, act
-
-        def maxValue(gameState, agentIndex, depth):
-            val = -math.inf
-            act = ""
-
-            for action in gameState.getLegalActions(agentIndex):
-                if agentIndex == gameState.getNumAgents() - 1:
-                    # Recursed in All agent. Back to pacman in new depth
-                    node = minimax(
-                        gameState.generateSuccessor(agentIndex, action), 0, depth + 1
-                    )
-                else:
-                    # Recurse in next ghost
-                    node = minimax(
-                        gameState.generateSuccessor(agentIndex, action),
-                        agentIndex + 1,
-                        depth,
-                    )
-
-                # Find action that maximize val
-                if val < node[0]:
-                    val = node[0]
-                    act = action
-            return val, act
-
-        return minimax(gameState, agentIndex=0, depth=0)[1]
+                with self.successor(gameState, agentIndex, action) as successor:
+                    node = self.minimax(successor, nextIndex, nextDepth)
+
+            # Find action that minimize val
+            if val > node[0]:
+                val = node[0]
+                act = action
+                line = [action] + self.pvLines[ply + 1]
+        self.pvLines[ply] = line
+        return val, act
+
+    def maxValue(self, gameState, agentIndex, depth):
+        val = -math.inf
+        act = ""
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        ply = self.getPly(gameState, agentIndex, depth)
+        line = []
+
+        for action in self.orderActions(gameState, agentIndex, depth):
+            self.pvLines[ply + 1] = []
+            with self.successor(gameState, agentIndex, action) as successor:
+                node = self.minimax(successor, nextIndex, nextDepth)
+
+            # Find action that maximize val
+            if val < node[0]:
+                val = node[0]
+                act = action
+                line = [action] + self.pvLines[ply + 1]
+        self.pvLines[ply] = line
+        return val, act
 
 
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
     Your minimax agent with alpha-beta pruning (question 3)
+
+    Setting numWorkers above 1 splits the search at the root: the first move
+    is searched here to get a bound, then the remaining moves are searched
+    in parallel with that bound ("young brothers wait") by a pool of worker
+    processes that persists across moves and games.
+
+    Setting moveOrdering searches the moves of every node in the order most
+    likely to cause a cutoff: the transposition table's best move, the
+    principal variation move, the two killer moves of the ply (recent moves
+    that caused a cutoff there), then the rest by their history score, which
+    grows each time a move by that agent from that cell causes a cutoff.
+    cutoffs and firstMoveCutoffs count, for the last move searched, the nodes
+    that were cut off and those cut off by the first move tried.
+
+    searchDriver picks how the tree is searched:
+
+      "plain" - alpha-beta with the full window.
+      "pvs"   - principal variation search: after the first move of a node,
+                each move is searched with a null window that only tells
+                whether it beats the best so far, and searched again with the
+                full window if it does.
+      "mtdf"  - MTD(f): a series of null-window searches of the root that
+                close in on its value from the previous value.  It relies on
+                a transposition table (ttSize) to make the repeated searches
+                cheap.
+
+    Setting aspirationWindow (plain and pvs) searches the root with a window
+    that wide on either side of the previous search's value, and again with
+    an open window on the failing side if the value falls outside.
+    researches counts, for the last move, the searches that were repeated.
     """
 
+    # Killer moves remembered per ply
+    NUM_KILLERS = 2
+
+    # Null-window root searches MTD(f) may make before it gives up on
+    # converging and falls back to one full-window search
+    MAX_MTDF_PASSES = 50
+
+    def __init__(
+        self,
+        evalFn="scoreEvaluationFunction",
+        depth="2",
+        numWorkers="1",
+        moveOrdering="False",
+        searchDriver="plain",
+        aspirationWindow="0",
+        **options,
+    ):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, **options)
+        if searchDriver not in ("plain", "pvs", "mtdf"):
+            raise ValueError("Unknown search driver: " + str(searchDriver))
+        self.numWorkers = int(numWorkers)
+        self.moveOrdering = parseFlag(moveOrdering)
+        self.searchDriver = searchDriver
+        self.aspirationWindow = float(aspirationWindow)
+        self.previousValue = None
+        self.killers = {}
+        self.history = {}
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.researches = 0
+        # Enough to build the same agent (minus the workers) in a worker
+        options = dict(
+            options,
+            evalFn=evalFn,
+            depth=depth,
+            moveOrdering=moveOrdering,
+            searchDriver=searchDriver,
+        )
+        self.workerSpec = (type(self).__name__, tuple(sorted(options.items())))
+
     def getAction(self, gameState):
         """
         Returns the minimax action using self.depth and self.evaluationFunction
         """
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.researches = 0
+        # Plies are counted from the root, so last move's killers are stale
+        self.killers = {}
+        # Older history counts less
+        for key in self.history:
+            self.history[key] //= 2
+        return self.chooseAction(gameState)
+
+    def search(self, gameState):
+        if self.numWorkers > 1:
+            # The root is split between processes; searchDriver applies below
+            return self.parallelSearch(gameState)
+        if self.searchDriver == "mtdf":
+            node = self.mtdf(gameState)
+        elif self.aspirationWindow > 0 and self.previousValue is not None:
+            node = self.aspirationSearch(gameState)
+        else:
+            node = self.alphaBeta(
+                gameState, agentIndex=0, depth=0, alpha=-math.inf, beta=math.inf
+            )
+        self.previousValue = node[0]
+        return node
 
-        def baseCase(gameState, depth):
-            # Base Case - Game is Over or reached max depth
-            # Stop recursion if any is true
-            return gameState.isWin() or gameState.isLose() or (depth == self.depth)
-
-        def alphaBeta(gameState, agentIndex, depth, alpha, beta):
-            if baseCase(gameState, depth):
-                return self.evaluationFunction(gameState), ""
-
-            elif agentIndex == 0:
-                # Want to maxize Pacman (evalScore the hight the better)
-                node = maxValue(gameState, agentIndex, depth, alpha, beta)
+    def aspirationSearch(self, gameState):
+        """
+        Searches the root with a window around the previous value, widening
+        it on the failing side if the value falls outside.
+        """
+        low = self.previousValue - self.aspirationWindow
+        high = self.previousValue + self.aspirationWindow
+        node = self.alphaBeta(gameState, 0, 0, low, high)
+        if node[0] <= low:
+            self.researches += 1
+            node = self.alphaBeta(gameState, 0, 0, -math.inf, high)
+        elif node[0] >= high:
+            self.researches += 1
+            node = self.alphaBeta(gameState, 0, 0, low, math.inf)
+        return node
+
+    def mtdf(self, gameState):
+        """
+        Finds the root value with null-window searches, starting from the
+        previous value (or the root's evaluation).
+        """
+        guess = self.previousValue
+        if guess is None:
+            guess = self.evaluationFunction(gameState)
+        lower, upper = -math.inf, math.inf
+        value = guess
+        best = None
+        for i in range(self.MAX_MTDF_PASSES):
+            if lower >= upper:
+                return best
+            # Values are floats, so the null window is one float wide:
+            # the search tells whether the root value reaches beta
+            beta = value if value > lower else math.nextafter(lower, math.inf)
+            low = math.nextafter(beta, -math.inf)
+            node = self.alphaBeta(gameState, 0, 0, low, beta)
+            value = node[0]
+            if value < beta:
+                upper = value
             else:
-                # Minimize the ghosts actions
-                node = minValue(gameState, agentIndex, depth, alpha, beta)
-            return node
-
-        def minValue(gameState, agentIndex, depth, alpha, beta):
-            val = math.inf
-            act = ""
-
-            for action in gameState.getLegalActions(agentIndex):
-                if agentIndex == gameState.getNumAgents() - 1:
-                    # Recursed in All agent. Back to pacman in new depth
-                    node = alphaBeta(
-                        gameState.generateSuccessor(agentIndex, action),
-                        0,
-                        depth + 1,
-                        alpha,
-                        beta,
-                    )
-                else:
-                    # Recurse in next ghost
-                    node = alphaBeta(
-                        gameState.generateSuccessor(agentIndex, action),
-                        agentIndex + 1,
-                        depth,
-                        alpha,
-                        beta,
-                    )
-
-                # Find action that minimize val
-                if val > node[0]:
-                    val = node[0]
+                lower = value
+                best = node
+            if i > 0:
+                self.researches += 1
+        if lower >= upper:
+            return best
+        self.researches += 1
+        return self.alphaBeta(gameState, 0, 0, -math.inf, math.inf)
+
+    def parallelSearch(self, gameState):
+        """
+        Searches the root's first move here and the others in worker processes.
+        """
+        actions = self.orderActions(gameState, 0, 0)
+        nextIndex, nextDepth = self.nextAgent(gameState, 0, 0)
+
+        # The eldest brother is searched first to bound the others
+        self.pvLines[1] = []
+        with self.successor(gameState, 0, actions[0]) as successor:
+            val = self.alphaBeta(
+                successor, nextIndex, nextDepth, -math.inf, math.inf
+            )[0]
+        act = actions[0]
+        line = [act] + self.pvLines[1]
+
+        if len(actions) > 1:
+            layoutText = tuple(gameState.data.layout.layoutText)
+            packed = gameState.packState()
+            tasks = [
+                (
+                    self.workerSpec,
+                    layoutText,
+                    packed,
+                    action,
+                    self.searchDepth,
+                    val,
+                    self.deadline,
+                    self.principalVariation,
+                )
+                for action in actions[1:]
+            ]
+            pool = util.getProcessPool(self.numWorkers)
+            results = pool.map(searchRootAction, tasks)
+            if None in results:
+                raise SearchTimeout()
+            for action, (value, childLine, nodes) in zip(actions[1:], results):
+                self.nodesExpanded += nodes
+                # Same tie-breaking as the sequential search
+                if val < value:
+                    val = value
                     act = action
+                    line = [action] + childLine
+
+        self.pvLines[0] = line
+        return val, act
+
+    def alphaBeta(self, gameState, agentIndex, depth, alpha, beta):
+        self.visitNode()
+        if self.baseCase(gameState, depth):
+            return self.evaluate(gameState), ""
+
+        forced = self.forcedMove(gameState, agentIndex)
+        if forced is not None:
+            return self.playForcedMove(
+                gameState, agentIndex, depth, forced, self.alphaBeta, alpha, beta
+            )
+
+        hashMove = None
+        entry = self.probeTransposition(gameState, agentIndex)
+        if entry is not None:
+            # Bounds are only usable if they fall outside the window
+            if entry.depth >= self.searchDepth - depth and (
+                entry.flag == EXACT
+                or (entry.flag == LOWERBOUND and entry.value >= beta)
+                or (entry.flag == UPPERBOUND and entry.value <= alpha)
+            ):
+                return entry.value, entry.bestMove
+            # A shallower search's best move is still a good first guess
+            hashMove = entry.bestMove
+
+        if agentIndex == 0:
+            # Want to maxize Pacman (evalScore the hight the better)
+            node = self.maxValue(gameState, agentIndex, depth, alpha, beta, hashMove)
+        else:
+            # Minimize the ghosts actions
+            node = self.minValue(gameState, agentIndex, depth, alpha, beta, hashMove)
+
+        if node[0] <= alpha:
+            flag = UPPERBOUND
+        elif node[0] >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        if not self.isGrouped(gameState, agentIndex, depth):
+            self.storeTransposition(gameState, agentIndex, depth, node, flag)
+        return node
 
-                if node[0] < alpha:
-                    # Prunning
-                    return val, act
-                beta = min(node[0], beta)
-
-            return val, act
-
-        def maxValue(gameState, agentIndex, depth, alpha, beta):
-            val = -math.inf
-            act = ""
-
-            for action in gameState.getLegalActions(agentIndex):
-                if agentIndex == gameState.getNumAgents() - 1:
-                    # Recursed in All agent. Back to pacman in new depth
-                    node = alphaBeta(
-                        gameState.generateSuccessor(agentIndex, action),
-                        0,
-                        depth + 1,
-                        alpha,
-                        beta,
+    def orderActions(self, gameState, agentIndex, depth, hashMove=None):
+        """
+        Returns the legal actions of agentIndex in search order: see the
+        class comment.  Without moveOrdering only the principal variation
+        move is moved to the front.
+        """
+        if not self.moveOrdering:
+            return MultiAgentSearchAgent.orderActions(
+                self, gameState, agentIndex, depth
+            )
+
+        actions = gameState.getLegalActions(agentIndex)
+        if len(actions) < 2:
+            return actions
+        pvMove = self.getPVMove(gameState, agentIndex, depth)
+        killers = self.killers.get(self.getPly(gameState, agentIndex, depth), ())
+        position = gameState.data.agentStates[agentIndex].getPosition()
+        history = self.history
+
+        def rank(action):
+            if action == hashMove:
+                return 0, 0
+            if action == pvMove:
+                return 1, 0
+            if action in killers:
+                return 2, killers.index(action)
+            return 3, -history.get((agentIndex, position, action), 0)
+
+        # sorted is stable, so untried moves keep the legal action order
+        return sorted(actions, key=rank)
+
+    def recordCutoff(self, gameState, agentIndex, depth, action, moveNumber):
+        """
+        Notes that action (the moveNumber-th move tried) cut off the search
+        of this node, updating the killer moves and the history table.
+        """
+        self.cutoffs += 1
+        if moveNumber == 0:
+            self.firstMoveCutoffs += 1
+        if not self.moveOrdering:
+            return
+
+        ply = self.getPly(gameState, agentIndex, depth)
+        killers = self.killers.setdefault(ply, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[self.NUM_KILLERS :]
+
+        # Cutoffs far from the leaves save the most work
+        remaining = self.searchDepth - depth
+        position = gameState.data.agentStates[agentIndex].getPosition()
+        key = (agentIndex, position, action)
+        self.history[key] = self.history.get(key, 0) + remaining * remaining
+
+    def scoutSearch(self, gameState, agentIndex, depth, alpha, beta, scout, ply):
+        """
+        PVS: searches gameState with the null window scout first, and again
+        with (alpha, beta) only if its value may fall inside that window.
+        """
+        node = self.alphaBeta(gameState, agentIndex, depth, *scout)
+        if alpha < node[0] < beta:
+            self.researches += 1
+            self.pvLines[ply + 1] = []
+            node = self.alphaBeta(gameState, agentIndex, depth, alpha, beta)
+        return node
+
+    def minValue(self, gameState, agentIndex, depth, alpha, beta, hashMove=None):
+        val = math.inf
+        act = ""
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        ply = self.getPly(gameState, agentIndex, depth)
+        line = []
+
+        actions = self.orderActions(gameState, agentIndex, depth, hashMove)
+        if self.groupGhosts:
+            key, actions = self.groupActions(
+                gameState, agentIndex, depth, actions
+            )
+        for moveNumber, action in enumerate(actions):
+            if self.groupGhosts:
+                self.ghostRound[agentIndex] = (key, action)
+            self.pvLines[ply + 1] = []
+            with self.successor(gameState, agentIndex, action) as successor:
+                if self.searchDriver == "pvs" and moveNumber > 0 and beta < math.inf:
+                    # Is this move any lower than beta?
+                    scout = (math.nextafter(beta, -math.inf), beta)
+                    node = self.scoutSearch(
+                        successor, nextIndex, nextDepth, alpha, beta, scout, ply
                     )
                 else:
-                    # Recurse in next ghost
-                    node = alphaBeta(
-                        gameState.generateSuccessor(agentIndex, action),
-                        agentIndex + 1,
-                        depth,
-                        alpha,
-                        beta,
+                    node = self.alphaBeta(successor, nextIndex, nextDepth, alpha, beta)
+
+            # Find action that minimize val
+            if val > node[0]:
+                val = node[0]
+                act = action
+                line = [action] + self.pvLines[ply + 1]
+
+            if node[0] < alpha:
+                # Prunning
+                self.recordCutoff(gameState, agentIndex, depth, action, moveNumber)
+                return val, act
+            beta = min(node[0], beta)
+
+        self.pvLines[ply] = line
+        return val, act
+
+    def maxValue(self, gameState, agentIndex, depth, alpha, beta, hashMove=None):
+        val = -math.inf
+        act = ""
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        ply = self.getPly(gameState, agentIndex, depth)
+        line = []
+
+        actions = self.orderActions(gameState, agentIndex, depth, hashMove)
+        for moveNumber, action in enumerate(actions):
+            self.pvLines[ply + 1] = []
+            with self.successor(gameState, agentIndex, action) as successor:
+                if self.searchDriver == "pvs" and moveNumber > 0 and alpha > -math.inf:
+                    # Is this move any higher than alpha?
+                    scout = (alpha, math.nextafter(alpha, math.inf))
+                    node = self.scoutSearch(
+                        successor, nextIndex, nextDepth, alpha, beta, scout, ply
                     )
+                else:
+                    node = self.alphaBeta(successor, nextIndex, nextDepth, alpha, beta)
 
-                # Find action that maximize val
-                if val < node[0]:
-                    val = node[0]
-                    act = action
+            # Find action that maximize val
+            if val < node[0]:
+                val = node[0]
+                act = action
+                line = [action] + self.pvLines[ply + 1]
 
-                if node[0] > beta:
-                    # Prunning
-                    return val, act
-                alpha = max(node[0], alpha)
-            return val, act
+            if node[0] > beta:
+                # Prunning
+                self.recordCutoff(gameState, agentIndex, depth, action, moveNumber)
+                return val, act
+            alpha = max(node[0], alpha)
 
-        return alphaBeta(
-            gameState, agentIndex=0, depth=0, alpha=-math.inf, beta=math.inf
-        )[1]
+        self.pvLines[ply] = line
+        return val, act
 
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
     """
     Your expectimax agent (question 4)
+
+    Setting starPruning to "star1" or "star2" prunes chance nodes with
+    Ballard's *-minimax.  Every value in the tree lies between bounds worked
+    out from the score rules of core/pacman.py and the range of the
+    evaluation function around the score (EVALUATION_BOUNDS, or evalBounds
+    given as "low:high"), so a chance node can stop as soon as the children
+    seen so far force its average outside the (alpha, beta) window.  "star2"
+    first probes one Pacman move below each child, which gives lower bounds
+    that allow cutoffs before any child is fully searched.  chanceCutoffs
+    and probeCutoffs count, for the last move, the chance nodes cut off.
     """
 
+    def __init__(
+        self,
+        evalFn="scoreEvaluationFunction",
+        depth="2",
+        starPruning="off",
+        evalBounds="",
+        **options,
+    ):
+        MultiAgentSearchAgent.__init__(self, evalFn, depth, **options)
+        if self.groupGhosts:
+            raise ValueError("groupGhosts needs minimizing ghosts")
+        if starPruning not in ("off", "star1", "star2"):
+            raise ValueError("Unknown star pruning: " + str(starPruning))
+        self.starPruning = None if starPruning == "off" else starPruning
+        if evalBounds:
+            low, high = evalBounds.split(":")
+            self.evalBounds = (float(low), float(high))
+        else:
+            self.evalBounds = EVALUATION_BOUNDS.get(self.evaluationFunction.__name__)
+        if self.starPruning is not None and self.evalBounds is None:
+            raise ValueError(
+                "Star pruning needs evalBounds for " + self.evaluationFunction.__name__
+            )
+        self.chanceCutoffs = 0
+        self.probeCutoffs = 0
+
     def getAction(self, gameState):
         """
         Returns the expectimax action using self.depth and self.evaluationFunction
@@ -366,112 +1070,553 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
         All ghosts should be modeled as choosing uniformly at random from their
         legal moves.
         """
+        self.chanceCutoffs = 0
+        self.probeCutoffs = 0
+        return self.chooseAction(gameState)
+
+    def search(self, gameState):
+        return self.expectiMax(gameState, agentIndex=0, depth=0)
+
+    def expectiMax(self, gameState, agentIndex, depth, alpha=-math.inf, beta=math.inf):
+        self.visitNode()
+        if self.baseCase(gameState, depth):
+            return self.evaluate(gameState), ""
+
+        forced = self.forcedMove(gameState, agentIndex)
+        if forced is not None:
+            return self.playForcedMove(
+                gameState, agentIndex, depth, forced, self.expectiMax, alpha, beta
+            )
+
+        entry = self.lookupTransposition(gameState, agentIndex, depth)
+        if entry is not None and (
+            entry.flag == EXACT
+            or (entry.flag == LOWERBOUND and entry.value >= beta)
+            or (entry.flag == UPPERBOUND and entry.value <= alpha)
+        ):
+            return entry.value, entry.bestMove
+
+        if agentIndex == 0:
+            # Want to maxize Pacman (evalScore the hight the better)
+            node = self.maxValue(gameState, agentIndex, depth, alpha, beta)
+        else:
+            # specificity of expectiminimax
+            node = self.helper(gameState, agentIndex, depth, alpha, beta)
+
+        # Without pruning every value is exact
+        flag = EXACT
+        if self.starPruning is not None:
+            if node[0] <= alpha:
+                flag = UPPERBOUND
+            elif node[0] >= beta:
+                flag = LOWERBOUND
+        self.storeTransposition(gameState, agentIndex, depth, node, flag)
+        return node
+
+    def helper(self, gameState, agentIndex, depth, alpha=-math.inf, beta=math.inf):
+        if self.starPruning is not None:
+            return self.starChance(gameState, agentIndex, depth, alpha, beta)
+
+        prob = 0
+        legalActions = gameState.getLegalActions(agentIndex)
+        fraction = 1 / len(legalActions)
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+
+        if self.isFrontier(gameState, agentIndex, depth):
+            values = self.evaluateChildren(gameState, agentIndex, legalActions)
+            for nodeValue in values:
+                prob += fraction * nodeValue
+            return prob, ""
 
-        def baseCase(gameState, depth):
-            # Base Case - Game is Over or reached max depth
-            # Stop recursion if any is true
-            return gameState.isWin() or gameState.isLose() or (depth == self.depth)
+        for action in legalActions:
+            with self.successor(gameState, agentIndex, action) as successor:
+                nodeValue = self.expectiMax(successor, nextIndex, nextDepth)[0]
 
-        def expectiMax(gameState, agentIndex, depth):
-            if baseCase(gameState, depth):
-                return self.evaluationFunction(gameState), ""
+            # Accumulate expected value
+            prob += fraction * nodeValue
 
-            elif agentIndex == 0:
-                # Want to maxize Pacman (evalScore the hight the better)
-                node = maxValue(gameState, agentIndex, depth)
-            else:
-                # specificity of expectiminimax
-                node = helper(gameState, agentIndex, depth)
-            return node
-
-        def helper(gameState, agentIndex, depth):
-            prob = 0
-            fraction = 1 / len(gameState.getLegalActions(agentIndex))
-
-            for action in gameState.getLegalActions(agentIndex):
-                if agentIndex == gameState.getNumAgents() - 1:
-                    # Recursed in All agent. Back to pacman in new depth
-                    nodeValue = expectiMax(
-                        gameState.generateSuccessor(agentIndex, action),
-                        0,
-                        depth + 1,
-                    )[0]
-                else:
-                    # Recurse in next ghost
-                    nodeValue = expectiMax(
-                        gameState.generateSuccessor(agentIndex, action),
-                        agentIndex + 1,
-                        depth,
-                    )[0]
-
-                # Accumulate expected value
-                prob += fraction * nodeValue
+        return prob, ""
 
-            return prob, ""
+    def valueBounds(self, gameState, depth):
+        """
+        Returns (lower, upper) bounds on the value of any node searched below
+        gameState: a few rounds can only change the score so much, and the
+        evaluation function stays within self.evalBounds of the score.
+        """
+        numGhosts = gameState.getNumAgents() - 1
+        rounds = self.searchDepth - depth
+        numFood = gameState.getNumFood()
+        score = gameState.getScore()
+
+        # The game ends at most once, but every ghost can catch Pacman then
+        lower = score - rounds * TIME_PENALTY - numGhosts * LOSE_PENALTY
+        upper = score + min(rounds, numFood) * FOOD_SCORE
+        if numFood <= rounds:
+            upper += WIN_SCORE
+        # Ghosts can only be eaten while scared, which takes a capsule
+        scared = any(ghost.scaredTimer > 0 for ghost in gameState.getGhostStates())
+        if scared or gameState.getCapsules():
+            upper += rounds * numGhosts * GHOST_SCORE
+        return lower + self.evalBounds[0], upper + self.evalBounds[1]
+
+    def starChance(self, gameState, agentIndex, depth, alpha, beta):
+        """
+        The chance node of helper with Star1 (or Star2) pruning.  Returns the
+        expected value, or a bound on it that lies outside (alpha, beta).
+        """
+        actions = gameState.getLegalActions(agentIndex)
+        numActions = len(actions)
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        lower, upper = self.valueBounds(gameState, depth)
+        lowerBounds = [lower] * numActions
+        sumLower = lower * numActions
+
+        if (
+            self.starPruning == "star2"
+            and nextIndex == 0
+            and nextDepth < self.searchDepth
+        ):
+            # Probe: the best of one Pacman move bounds each child from below
+            for i, action in enumerate(actions):
+                # A child value this high makes the average reach beta
+                highCut = numActions * beta - (sumLower - lowerBounds[i])
+                with self.successor(gameState, agentIndex, action) as successor:
+                    value = self.probe(successor, nextDepth, lower, min(highCut, upper))
+                if value >= highCut:
+                    self.probeCutoffs += 1
+                    return (sumLower - lowerBounds[i] + value) / numActions, ""
+                if value > lower:
+                    sumLower += value - lowerBounds[i]
+                    lowerBounds[i] = value
+
+        searched = 0.0
+        for i, action in enumerate(actions):
+            restLower = sumLower - lowerBounds[i]
+            restUpper = upper * (numActions - i - 1)
+            # Child values at or past these settle which side of the window
+            # the average falls on, whatever the other children are worth
+            lowCut = numActions * alpha - searched - restUpper
+            highCut = numActions * beta - searched - restLower
+            with self.successor(gameState, agentIndex, action) as successor:
+                value = self.expectiMax(
+                    successor,
+                    nextIndex,
+                    nextDepth,
+                    max(lowCut, lower),
+                    min(highCut, upper),
+                )[0]
+            if value <= lowCut:
+                self.chanceCutoffs += 1
+                return (searched + value + restUpper) / numActions, ""
+            if value >= highCut:
+                self.chanceCutoffs += 1
+                return (searched + value + restLower) / numActions, ""
+            searched += value
+            sumLower = restLower
+
+        return searched / numActions, ""
+
+    def probe(self, gameState, depth, alpha, beta):
+        """
+        Returns a lower bound on the value of the Pacman node gameState found
+        by searching only its first move (with the window (alpha, beta)).
+        """
+        self.visitNode()
+        if self.baseCase(gameState, depth):
+            return self.evaluate(gameState)
+        action = self.orderActions(gameState, 0, depth)[0]
+        nextIndex, nextDepth = self.nextAgent(gameState, 0, depth)
+        with self.successor(gameState, 0, action) as successor:
+            return self.expectiMax(successor, nextIndex, nextDepth, alpha, beta)[0]
+
+    def maxValue(self, gameState, agentIndex, depth, alpha=-math.inf, beta=math.inf):
+        val = -math.inf
+        act = ""
+        nextIndex, nextDepth = self.nextAgent(gameState, agentIndex, depth)
+        ply = self.getPly(gameState, agentIndex, depth)
+        line = []
+
+        for action in self.orderActions(gameState, agentIndex, depth):
+            # The principal variation stops at the ghosts' chance nodes
+            self.pvLines[ply + 1] = []
+            with self.successor(gameState, agentIndex, action) as successor:
+                node = self.expectiMax(
+                    successor, nextIndex, nextDepth, max(alpha, val), beta
+                )
+
+            # Find action that maximize val
+            if val < node[0]:
+                val = node[0]
+                act = action
+                line = [action] + self.pvLines[ply + 1]
+
+            if val >= beta:
+                # Only happens with star pruning
+                return val, act
+        self.pvLines[ply] = line
+        return val, act
+
+
+class MCTSNode:
+    """
+    A Pacman decision point of the MCTSAgent's tree.  The tree is open loop:
+    a node stands for a sequence of Pacman moves, whatever the ghosts did in
+    between, and its statistics average over the ghost moves sampled on the
+    way down.
+    """
 
-        def maxValue(gameState, agentIndex, depth):
-            val = -math.inf
-            act = ""
+    __slots__ = ("children", "visits", "totalValue")
 
-            for action in gameState.getLegalActions(agentIndex):
-                if agentIndex == gameState.getNumAgents() - 1:
-                    # Recursed in All agent. Back to pacman in new depth
-                    node = expectiMax(
-                        gameState.generateSuccessor(agentIndex, action), 0, depth + 1
-                    )
-                else:
-                    # Recurse in next ghost
-                    node = expectiMax(
-                        gameState.generateSuccessor(agentIndex, action),
-                        agentIndex + 1,
-                        depth,
-                    )
+    def __init__(self):
+        self.children = {}
+        self.visits = 0
+        self.totalValue = 0.0
 
-                # Find action that maximize val
-                if val < node[0]:
-                    val = node[0]
-                    act = action
-            return val, act
+    def meanValue(self):
+        return self.totalValue / self.visits
 
-        return expectiMax(gameState, agentIndex=0, depth=0)[1]
 
+class MCTSAgent(Agent):
+    """
+    A Monte Carlo tree search (UCT) agent.
+
+    Every iteration walks down the tree picking Pacman moves by UCB1 with
+    exploration constant exploration, adds one new node, and plays a rollout
+    from there for up to rolloutDepth Pacman moves before scoring the state
+    with evalFn.  Ghost moves, both in the tree and in rollouts, are sampled
+    from ghostAgent's distributions (core/ghostAgents.py).
+
+    rolloutPolicy is "random" (any legal move but Stop) or "greedy" (the move
+    with the best immediate score, ties broken at random).  The search runs
+    for timeBudgetMs milliseconds per move if that is positive, otherwise for
+    iterations iterations.  It then plays the most visited move and keeps the
+    subtree below it for the next turn unless reuseTree is off.
+    """
+
+    def __init__(
+        self,
+        evalFn="betterEvaluationFunction",
+        exploration="1.4",
+        rolloutPolicy="greedy",
+        rolloutDepth="3",
+        iterations="200",
+        timeBudgetMs="0",
+        ghostAgent="DirectionalGhost",
+        reuseTree="True",
+    ):
+        self.index = 0  # Pacman is always agent index 0
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        self.exploration = float(exploration)
+        if rolloutPolicy not in ("random", "greedy"):
+            raise ValueError("Unknown rollout policy: " + str(rolloutPolicy))
+        self.rolloutPolicy = rolloutPolicy
+        self.rolloutDepth = int(rolloutDepth)
+        self.iterations = int(iterations)
+        self.timeBudget = float(timeBudgetMs) / 1000.0
+        self.ghostType = getattr(ghostAgents, ghostAgent)
+        self.reuseTree = parseFlag(reuseTree)
+        self.ghostModels = None
+        self.root = None
+        self.lastAction = None
+        # Range of the values backed up so far, for scaling UCB1
+        self.minValue = math.inf
+        self.maxValue = -math.inf
+
+    def registerInitialState(self, gameState):
+        self.root = None
+        self.lastAction = None
 
-def betterEvaluationFunction(currentGameState):
+    def getAction(self, gameState):
+        """
+        Returns the most visited root move after searching gameState.
+        """
+        numGhosts = gameState.getNumAgents() - 1
+        if self.ghostModels is None or len(self.ghostModels) != numGhosts:
+            self.ghostModels = [self.ghostType(i + 1) for i in range(numGhosts)]
+
+        root = None
+        if self.reuseTree and self.root is not None:
+            root = self.root.children.get(self.lastAction)
+        if root is None:
+            root = MCTSNode()
+        self.minValue = math.inf
+        self.maxValue = -math.inf
+
+        if self.timeBudget > 0:
+            deadline = time.time() + self.timeBudget
+            # Always run one iteration so every legal move can be compared
+            self.iterate(root, gameState)
+            while time.time() < deadline:
+                self.iterate(root, gameState)
+        else:
+            for i in range(self.iterations):
+                self.iterate(root, gameState)
+
+        legal = gameState.getLegalActions(0)
+        visited = [action for action in legal if action in root.children]
+        if not visited:
+            return random.choice(legal)
+        action = max(visited, key=lambda a: root.children[a].visits)
+        self.root = root
+        self.lastAction = action
+        return action
+
+    def iterate(self, root, gameState):
+        """
+        Runs one selection, expansion, rollout and backup pass.
+        """
+        node = root
+        path = [root]
+        state = gameState
+        while not (state.isWin() or state.isLose()):
+            actions = state.getLegalActions(0)
+            untried = [action for action in actions if action not in node.children]
+            if untried:
+                action = random.choice(untried)
+                node.children[action] = MCTSNode()
+                state = self.simulateMove(state, action)
+                path.append(node.children[action])
+                break
+            action = self.selectAction(node, actions)
+            node = node.children[action]
+            state = self.simulateMove(state, action)
+            path.append(node)
+
+        value = self.rollout(state)
+        self.minValue = min(self.minValue, value)
+        self.maxValue = max(self.maxValue, value)
+        for node in path:
+            node.visits += 1
+            node.totalValue += value
+
+    def selectAction(self, node, actions):
+        """
+        Returns the action whose child has the highest UCB1 score, with mean
+        values scaled to [0, 1] by the range seen in this search.
+        """
+        spread = self.maxValue - self.minValue
+        logVisits = math.log(node.visits)
+        bestScore = -math.inf
+        bestActions = []
+        for action in actions:
+            child = node.children[action]
+            mean = child.meanValue()
+            if spread > 0:
+                mean = (mean - self.minValue) / spread
+            else:
+                mean = 0.5
+            score = mean + self.exploration * math.sqrt(logVisits / child.visits)
+            if score > bestScore:
+                bestScore = score
+                bestActions = [action]
+            elif score == bestScore:
+                bestActions.append(action)
+        return random.choice(bestActions)
+
+    def simulateMove(self, gameState, action):
+        """
+        Returns the state after Pacman plays action and every ghost answers
+        with a move sampled from its model.
+        """
+        state = gameState.generateSuccessor(0, action)
+        for ghost in self.ghostModels:
+            if state.isWin() or state.isLose():
+                break
+            state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+        return state
+
+    def rollout(self, gameState):
+        """
+        Plays rolloutPolicy for up to rolloutDepth Pacman moves and returns
+        the evaluation of the state reached.
+        """
+        state = gameState
+        for i in range(self.rolloutDepth):
+            if state.isWin() or state.isLose():
+                break
+            actions = [a for a in state.getLegalActions(0) if a != Directions.STOP]
+            if not actions:
+                actions = state.getLegalActions(0)
+            if self.rolloutPolicy == "greedy":
+                scored = [
+                    (state.generateSuccessor(0, a).getScore(), a) for a in actions
+                ]
+                bestScore = max(scored)[0]
+                actions = [a for score, a in scored if score == bestScore]
+            state = self.simulateMove(state, random.choice(actions))
+        return self.evaluationFunction(state)
+
+
+class JunctionAgent(Agent):
+    """
+    A Pacman agent that plans over corridors instead of single steps.
+
+    Its macro-actions follow a corridor of the maze's JunctionGraph
+    (core/layout.py) to the next junction.  The agent tries every sequence
+    of depth macro-actions, moving each ghost one step per Pacman step as
+    ghostAgent (core/ghostAgents.py) most likely would, scores the states
+    reached with evalFn and takes the first step of the best sequence.  It
+    plans again on every move, so it turns back when a ghost shows up.
+    nodesExpanded counts the macro-actions tried for the last move.
+    """
+
+    def __init__(
+        self,
+        evalFn="betterEvaluationFunction",
+        depth="2",
+        ghostAgent="DirectionalGhost",
+    ):
+        self.index = 0  # Pacman is always agent index 0
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        self.depth = int(depth)
+        self.ghostType = getattr(ghostAgents, ghostAgent)
+        self.ghostModels = None
+        self.nodesExpanded = 0
+
+    def getAction(self, gameState):
+        """
+        Returns the first step of the best sequence of macro-actions.
+        """
+        numGhosts = gameState.getNumAgents() - 1
+        if self.ghostModels is None or len(self.ghostModels) != numGhosts:
+            self.ghostModels = [self.ghostType(i + 1) for i in range(numGhosts)]
+        self.nodesExpanded = 0
+
+        value, action = self.plan(gameState, 0)
+        if action is None:
+            # Pacman is off the graph (on the open border of the maze)
+            legal = gameState.getLegalActions(0)
+            action = max(
+                legal,
+                key=lambda a: self.evaluationFunction(self.simulateStep(gameState, a)),
+            )
+        return action
+
+    def plan(self, gameState, depth):
+        """
+        Returns (value, first action) of the best sequence of macro-actions
+        from gameState that is depth macro-actions into the plan.
+        """
+        if depth == self.depth or gameState.isWin() or gameState.isLose():
+            return self.evaluationFunction(gameState), None
+
+        graph = gameState.getJunctionGraph()
+        bestValue = -math.inf
+        bestAction = None
+        for corridor, offset in graph.getExits(gameState.getPacmanPosition()):
+            self.nodesExpanded += 1
+            state = gameState
+            for action in corridor.actions[offset:]:
+                state = self.simulateStep(state, action)
+                if state.isWin() or state.isLose():
+                    break
+            value = self.plan(state, depth + 1)[0]
+            if value > bestValue:
+                bestValue = value
+                bestAction = corridor.actions[offset]
+        if bestAction is None:
+            return self.evaluationFunction(gameState), None
+        return bestValue, bestAction
+
+    def simulateStep(self, gameState, action):
+        """
+        Returns the state after Pacman plays action and every ghost answers
+        with its most likely move.
+        """
+        state = gameState.generateSuccessor(0, action)
+        for ghost in self.ghostModels:
+            if state.isWin() or state.isLose():
+                break
+            move = ghost.getDistribution(state).argMax()
+            state = state.generateSuccessor(ghost.index, move)
+        return state
+
+
+# Per-process caches of the parallel search workers
+_WORKER_AGENTS = {}
+_WORKER_LAYOUTS = {}
+
+
+def searchRootAction(task):
+    """
+    Runs in a worker process: searches one root move of a parallel
+    AlphaBetaAgent with the window (alpha, inf).  Returns (value, principal
+    variation below the move, nodes searched), or None if time ran out.
+    """
+    workerSpec, layoutText, packed, action, searchDepth, alpha, deadline, pv = task
+
+    agent = _WORKER_AGENTS.get(workerSpec)
+    if agent is None:
+        className, options = workerSpec
+        agent = globals()[className](**dict(options))
+        _WORKER_AGENTS[workerSpec] = agent
+    layout = _WORKER_LAYOUTS.get(layoutText)
+    if layout is None:
+        layout = _WORKER_LAYOUTS[layoutText] = Layout(list(layoutText))
+
+    gameState = GameState.unpackState(packed, layout)
+    agent.searchDepth = searchDepth
+    agent.deadline = deadline
+    agent.principalVariation = pv
+    agent.nodesExpanded = 0
+    agent.pvLines = {1: []}
+    nextIndex, nextDepth = agent.nextAgent(gameState, 0, 0)
+    try:
+        value = agent.alphaBeta(
+            gameState.generateSuccessor(0, action),
+            nextIndex,
+            nextDepth,
+            alpha,
+            math.inf,
+        )[0]
+    except SearchTimeout:
+        return None
+    return value, agent.pvLines[1], agent.nodesExpanded
+
+
+def betterEvaluationFunction(currentGameState, distance=util.manhattanDistance):
     """
     Your extreme ghost-hunting, pellet-nabbing, food-gobbling, unstoppable
     evaluation function (question 5).
 
     DESCRIPTION: Enhanced evaluation function that properly handles scared ghosts,
                  capsules, and food collection with strategic priorities.
+                 distance measures how far apart two positions are.
     """
     newPos = currentGameState.getPacmanPosition()
-    newFood = currentGameState.getFood()
-    newCapsule = currentGameState.getCapsules()
+    return scoreFeatures(
+        currentGameState, newPos, foodFeatures(currentGameState, distance), distance
+    )
+
+
+def foodFeatures(currentGameState, distance):
+    """
+    The part of betterEvaluationFunction that depends only on Pacman's
+    position, the food and the capsules: returns (closest food distance,
+    closest capsule distance, food left), with None for distances to
+    nothing.  The state keeps the distances (see GameState.getFoodFeatures).
+    """
+    closestFood, closestCapsule = currentGameState.getFoodFeatures(distance)
+    return closestFood, closestCapsule, currentGameState.getNumFood()
+
+
+def scoreFeatures(currentGameState, newPos, features, distance):
+    """
+    Scores currentGameState for betterEvaluationFunction from its
+    foodFeatures and its ghosts.
+    """
+    closestFood, closestCapsule, remainingFood = features
     newGhostStates = currentGameState.getGhostStates()
     newScaredTimes = [ghostState.scaredTimer for ghostState in newGhostStates]
 
     # Set up stating score from previous state
     score = currentGameState.getScore()
 
-    # Calculate food distances
-    foodDistances = []
-    for food in newFood.asList():
-        foodDistances.append(util.manhattanDistance(newPos, food))
-
-    if foodDistances:
-        closestFood = min(foodDistances)
+    if closestFood is not None:
         # Reward for being close to food
         score += 10 / (closestFood + 1)
-    else:
-        closestFood = 1
-
-    # Calculate capsule distances
-    capsuleDistances = []
-    for capsule in newCapsule:
-        capsuleDistances.append(util.manhattanDistance(newPos, capsule))
 
-    if capsuleDistances:
-        closestCapsule = min(capsuleDistances)
+    if closestCapsule is not None:
         # Strong reward for being close to capsules (they make ghosts scared)
         score += 50 / (closestCapsule + 1)
 
@@ -480,7 +1625,7 @@ def betterEvaluationFunction(currentGameState):
     dangerousGhostDistances = []
 
     for i, ghost in enumerate(newGhostStates):
-        ghostDistance = util.manhattanDistance(newPos, ghost.getPosition())
+        ghostDistance = distance(newPos, ghost.getPosition())
 
         # Check if this ghost is scared
         if newScaredTimes[i] > 0:
@@ -505,7 +1650,6 @@ def betterEvaluationFunction(currentGameState):
             score -= 2000 / (closestDangerousGhost + 1)
 
     # Bonus for having few remaining food pellets
-    remainingFood = len(foodDistances)
     if remainingFood <= 5:
         # Extra reward when close to winning
         score += (10 - remainingFood) * 50
@@ -513,5 +1657,66 @@ def betterEvaluationFunction(currentGameState):
     return score
 
 
+def betterEvaluationBatch(states, features=None, distance=util.manhattanDistance):
+    """
+    Returns betterEvaluationFunction of each of states, scored in one call.
+
+    States that share Pacman's position, food and capsules share their
+    foodFeatures, which are most of the work.  Leaves at the search frontier
+    mostly do: they differ in where the ghosts went.  features may be a
+    dictionary kept across calls, to share them between batches too.
+    """
+    if features is None:
+        features = {}
+    values = []
+    for state in states:
+        newPos = state.getPacmanPosition()
+        key = (newPos, state.getFood().bits, tuple(state.getCapsules()))
+        found = features.get(key)
+        if found is None:
+            found = features[key] = foodFeatures(state, distance)
+        values.append(scoreFeatures(state, newPos, found, distance))
+    return values
+
+
+def mazeEvaluationFunction(currentGameState):
+    """
+    betterEvaluationFunction with distances measured along the maze rather
+    than through walls, using the layout's precomputed distance table.
+    """
+    distances = currentGameState.data.layout.getMazeDistances()
+    return betterEvaluationFunction(currentGameState, distances.getDistance)
+
+
+def mazeEvaluationBatch(states, features=None):
+    """
+    mazeEvaluationFunction of each of states (of one layout), scored in one
+    call as betterEvaluationBatch does.
+    """
+    if not states:
+        return []
+    distances = states[0].data.layout.getMazeDistances()
+    return betterEvaluationBatch(states, features, distances.getDistance)
+
+
 # Abbreviation
 better = betterEvaluationFunction
+maze = mazeEvaluationFunction
+
+
+# Evaluation functions that can score many states in one call, and the
+# function that does it: fn(states, features) where features is a dictionary
+# the caller keeps for the length of a search
+BATCH_EVALUATIONS = {
+    "betterEvaluationFunction": betterEvaluationBatch,
+    "mazeEvaluationFunction": mazeEvaluationBatch,
+}
+
+
+# How far each evaluation function can stray from the state's score, which
+# bounds the values ExpectimaxAgent's star pruning works with
+EVALUATION_BOUNDS = {
+    "scoreEvaluationFunction": (0, 0),
+    "betterEvaluationFunction": (-2000, 860),
+    "mazeEvaluationFunction": (-2000, 860),
+}
@@ -0,0 +1,154 @@
+# transposition.py
+# ----------------
+
+
+"""
+A size-bounded transposition table shared by the adversarial search agents
+in multi_agents.py.
+
+Ghost move orders and Pacman's back-and-forth moves lead the search to the
+same GameState many times.  The table remembers what was learned about a
+position (its value, how deep it was searched, whether that value is exact or
+only a bound, and the best move found) so the search can reuse it instead of
+expanding the subtree again.
+"""
+
+from collections import OrderedDict
+
+# Bound types stored alongside a value
+EXACT = 0
+LOWERBOUND = 1  # The true value is >= the stored value (fail high)
+UPPERBOUND = 2  # The true value is <= the stored value (fail low)
+
+# Replacement policies
+LRU = "lru"
+DEPTH_PREFERRED = "depth"
+
+
+class TranspositionEntry:
+    """
+    What the search learned about one position.
+
+    depth is the number of plies that were searched below the position, so an
+    entry can answer any query that needs a search of that depth or less.
+    """
+
+    __slots__ = ("value", "depth", "flag", "bestMove")
+
+    def __init__(self, value, depth, flag, bestMove):
+        self.value = value
+        self.depth = depth
+        self.flag = flag
+        self.bestMove = bestMove
+
+    def __str__(self):
+        return "value=%s, depth=%d, flag=%d, bestMove=%s" % (
+            self.value,
+            self.depth,
+            self.flag,
+            self.bestMove,
+        )
+
+
+class TranspositionTable:
+    """
+    A bounded map from position keys to TranspositionEntry objects.
+
+    Two replacement policies are supported once the table is full:
+
+      "lru"   - evict the least recently used entry.
+      "depth" - the table is a fixed array of slots indexed by the key's hash;
+                a colliding entry only replaces the slot's occupant if it was
+                searched at least as deep.
+
+    Keys must be hashable and compare equal exactly when they describe the
+    same position; the search agents use the state's Zobrist key together
+    with the index of the agent to move.  Hit, miss and store counters are
+    kept for tuning.
+    """
+
+    def __init__(self, size=100000, policy=LRU):
+        if size <= 0:
+            raise ValueError("Transposition table size must be positive")
+        if policy not in (LRU, DEPTH_PREFERRED):
+            raise ValueError("Unknown replacement policy: " + str(policy))
+        self.size = size
+        self.policy = policy
+        self.clear()
+
+    def clear(self):
+        if self.policy == LRU:
+            self.entries = OrderedDict()
+        else:
+            self.slots = [None] * self.size
+            self.numEntries = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        if self.policy == LRU:
+            return len(self.entries)
+        return self.numEntries
+
+    def lookup(self, key):
+        """
+        Returns the TranspositionEntry stored for key, or None.
+        """
+        if self.policy == LRU:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        else:
+            slot = self.slots[hash(key) % self.size]
+            entry = slot[1] if slot is not None and slot[0] == key else None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key, value, depth, flag, bestMove):
+        """
+        Records the result of searching the position key to the given depth.
+        """
+        entry = TranspositionEntry(value, depth, flag, bestMove)
+        if self.policy == LRU:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            elif len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.entries[key] = entry
+        else:
+            index = hash(key) % self.size
+            slot = self.slots[index]
+            if slot is None:
+                self.numEntries += 1
+            elif slot[0] != key:
+                if slot[1].depth > depth:
+                    # Keep the deeper search result
+                    return
+                self.evictions += 1
+            self.slots[index] = (key, entry)
+        self.stores += 1
+
+    def hitRate(self):
+        probes = self.hits + self.misses
+        if probes == 0:
+            return 0.0
+        return float(self.hits) / probes
+
+    def __str__(self):
+        return "TranspositionTable(%s, %d/%d entries, hits=%d, misses=%d)" % (
+            self.policy,
+            len(self),
+            self.size,
+            self.hits,
+            self.misses,
+        )
@@ -0,0 +1,292 @@
+# batch.py
+# --------
+
+
+"""
+Runs many headless Pacman games in parallel and reports one JSON line per
+game.  This is the tool for evaluating agent changes: every game gets its own
+random seed, so a batch can be rerun exactly and two agents can be compared
+on the same games.
+
+Run it from the project root:
+
+  > python -m core.batch -l mediumClassic -p AlphaBetaAgent -a depth=2 \\
+        --seeds 0-99 -j 8 -o results.jsonl
+
+Each output line looks like
+
+  {"seed": 3, "layout": "mediumClassic", "score": 1271.0, "win": true,
+   "moves": 402, "agentTimes": [5.1, 0.02, 0.02], ...}
+
+where moves counts Pacman's moves and agentTimes holds the seconds each
+agent spent choosing actions.  Games are handed to worker processes one at a
+time and lines are written as games finish, so results stream in completion
+order rather than seed order.
+"""
+
+import json
+import random
+import sys
+import time
+
+from . import layout
+from . import util
+from .pacman import ClassicGameRules, loadAgent, parseAgentArgs
+
+# Layouts already loaded by this (worker) process, by name
+_BATCH_LAYOUTS = {}
+
+
+class BatchSpec:
+    """
+    Everything a worker needs to set up one game of the batch, except the
+    seed.  Agents are named by class and built inside the worker, so each
+    game starts from fresh agents no matter which process plays it.
+    """
+
+    def __init__(
+        self,
+        layoutName,
+        pacman="AlphaBetaAgent",
+        agentArgs=None,
+        ghost="RandomGhost",
+        numGhosts=4,
+        timeout=30,
+        catchExceptions=False,
+    ):
+        self.layoutName = layoutName
+        self.pacman = pacman
+        self.agentArgs = agentArgs or {}
+        self.ghost = ghost
+        self.numGhosts = numGhosts
+        self.timeout = timeout
+        self.catchExceptions = catchExceptions
+
+
+def runBatchGame(task):
+    """
+    Plays the game for one (BatchSpec, seed) pair and returns its result
+    dictionary.  This is the function the worker processes run.
+    """
+    from display import textDisplay
+
+    spec, seed = task
+    if spec.layoutName not in _BATCH_LAYOUTS:
+        gameLayout = layout.getLayout(spec.layoutName)
+        if gameLayout is None:
+            raise Exception("The layout " + spec.layoutName + " cannot be found")
+        _BATCH_LAYOUTS[spec.layoutName] = gameLayout
+    gameLayout = _BATCH_LAYOUTS[spec.layoutName]
+
+    random.seed(seed)
+    pacmanType = loadAgent(spec.pacman, True)
+    ghostType = loadAgent(spec.ghost, True)
+    pacman = pacmanType(**spec.agentArgs)
+    ghosts = [ghostType(i + 1) for i in range(spec.numGhosts)]
+
+    rules = ClassicGameRules(spec.timeout)
+    game = rules.newGame(
+        gameLayout,
+        pacman,
+        ghosts,
+        textDisplay.NullGraphics(),
+        True,
+        spec.catchExceptions,
+    )
+    start = time.time()
+    game.run()
+    elapsed = time.time() - start
+
+    state = game.state
+    return {
+        "seed": seed,
+        "layout": spec.layoutName,
+        "pacman": spec.pacman,
+        "ghost": spec.ghost,
+        "score": state.getScore(),
+        "win": state.isWin(),
+        "moves": sum(1 for agentIndex, action in game.moveHistory if agentIndex == 0),
+        "agentTimes": [round(t, 6) for t in game.totalAgentTimes],
+        "time": round(elapsed, 6),
+        "crashed": game.agentCrashed,
+    }
+
+
+def runBatch(spec, seeds, numWorkers=1, out=None):
+    """
+    Plays one game of spec per seed and writes a JSON line for each to out
+    as soon as it finishes.  With numWorkers > 1 the games are spread over a
+    persistent process pool.  Returns the list of result dictionaries.
+
+    Agents that start their own process pools (AlphaBetaAgent with
+    numWorkers > 1) cannot be used with numWorkers > 1 here, because pool
+    workers may not have children of their own.
+    """
+    tasks = [(spec, seed) for seed in seeds]
+    if numWorkers > 1:
+        pool = util.getProcessPool(numWorkers)
+        results = pool.imap_unordered(runBatchGame, tasks)
+    else:
+        results = map(runBatchGame, tasks)
+
+    games = []
+    for result in results:
+        games.append(result)
+        if out is not None:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    return games
+
+
+def parseSeeds(seedStr):
+    """
+    Turns "0-99" or "1,5,9" (or a mix such as "0-9,20") into a list of seeds.
+    """
+    seeds = []
+    for piece in seedStr.split(","):
+        if "-" in piece:
+            first, last = piece.split("-")
+            seeds.extend(range(int(first), int(last) + 1))
+        else:
+            seeds.append(int(piece))
+    return seeds
+
+
+def summarize(games):
+    """
+    Returns a one-line summary of a list of batch results.
+    """
+    if not games:
+        return "No games played"
+    scores = [game["score"] for game in games]
+    wins = [game["win"] for game in games]
+    return "Games: %d  Average Score: %.2f  Win Rate: %d/%d (%.2f)" % (
+        len(games),
+        sum(scores) / float(len(scores)),
+        wins.count(True),
+        len(wins),
+        wins.count(True) / float(len(wins)),
+    )
+
+
+def readCommand(argv):
+    """
+    Processes the command used to run a batch from the command line.
+    """
+    from optparse import OptionParser
+
+    usageStr = """
+    USAGE:      python -m core.batch <options>
+    EXAMPLES:   (1) python -m core.batch -l smallClassic -p ExpectimaxAgent
+                    - plays 10 games of ExpectimaxAgent on smallClassic
+                (2) python -m core.batch -p AlphaBetaAgent -a depth=3 --seeds 0-199 -j 8
+                    - plays 200 seeded games on 8 processes
+    """
+    parser = OptionParser(usageStr)
+
+    def default(helpStr):
+        return helpStr + " [Default: %default]"
+
+    parser.add_option(
+        "-l",
+        "--layout",
+        dest="layout",
+        help=default("the LAYOUT_FILE from which to load the map layout"),
+        metavar="LAYOUT_FILE",
+        default="mediumClassic",
+    )
+    parser.add_option(
+        "-p",
+        "--pacman",
+        dest="pacman",
+        help=default("the agent TYPE in the pacmanAgents module to use"),
+        metavar="TYPE",
+        default="AlphaBetaAgent",
+    )
+    parser.add_option(
+        "-a",
+        "--agentArgs",
+        dest="agentArgs",
+        help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"',
+    )
+    parser.add_option(
+        "-g",
+        "--ghosts",
+        dest="ghost",
+        help=default("the ghost agent TYPE in the ghostAgents module to use"),
+        metavar="TYPE",
+        default="RandomGhost",
+    )
+    parser.add_option(
+        "-k",
+        "--numghosts",
+        type="int",
+        dest="numGhosts",
+        help=default("The maximum number of ghosts to use"),
+        default=4,
+    )
+    parser.add_option(
+        "-s",
+        "--seeds",
+        dest="seeds",
+        help=default('Seeds to play, one game each, e.g. "0-99" or "1,5,9"'),
+        default="0-9",
+    )
+    parser.add_option(
+        "-j",
+        "--workers",
+        type="int",
+        dest="numWorkers",
+        help=default("Number of worker processes"),
+        default=1,
+    )
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output",
+        help="File to write the JSON lines to [Default: standard output]",
+        default=None,
+    )
+    parser.add_option(
+        "-c",
+        "--catchExceptions",
+        action="store_true",
+        dest="catchExceptions",
+        help="Turns on exception handling and timeouts during games",
+        default=False,
+    )
+    parser.add_option(
+        "--timeout",
+        dest="timeout",
+        type="int",
+        help=default(
+            "Maximum length of time an agent can spend computing in a single game"
+        ),
+        default=30,
+    )
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception("Command line input not understood: " + str(otherjunk))
+
+    spec = BatchSpec(
+        options.layout,
+        options.pacman,
+        parseAgentArgs(options.agentArgs),
+        options.ghost,
+        options.numGhosts,
+        options.timeout,
+        options.catchExceptions,
+    )
+    return spec, parseSeeds(options.seeds), options.numWorkers, options.output
+
+
+if __name__ == "__main__":
+    spec, seeds, numWorkers, output = readCommand(sys.argv[1:])
+    out = sys.stdout if output is None else open(output, "w")
+    try:
+        games = runBatch(spec, seeds, numWorkers, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(summarize(games), file=sys.stderr)
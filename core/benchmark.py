@@ -0,0 +1,423 @@
+# benchmark.py
+# ------------
+
+
+"""
+Times the engine and search hot paths on every bundled layout:
+
+  generateSuccessor  - successor generation for every legal move
+  getLegalActions    - legal moves of every agent
+  eval:<name>        - the evaluation functions of multi_agents.py
+  <Agent>@<depth>    - full getAction calls of the search agents, with the
+                       agent options in brackets if there are any
+
+Each layout is sampled by a random playout with a fixed seed, so every run
+times the same states.  Each benchmark runs its whole workload several times
+and keeps the fastest run, as timeit does.  Results are written as JSON:
+
+  > python -m core.benchmark -o before.json
+  > python -m core.benchmark --baseline before.json
+
+The second form also compares every benchmark against the saved results,
+prints the ratios to standard error and exits with status 1 if anything got
+slower than the tolerance allows.
+"""
+
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from . import layout
+from .pacman import GameState
+
+# Evaluation functions of multi_agents.py that are timed
+EVALUATION_FUNCTIONS = [
+    "scoreEvaluationFunction",
+    "betterEvaluationFunction",
+    "mazeEvaluationFunction",
+]
+
+# Search agents whose getAction is timed, with their options
+SEARCH_AGENTS = [
+    ("AlphaBetaAgent", {}),
+    ("AlphaBetaAgent", {"searchDriver": "pvs", "ttSize": "100000"}),
+    ("AlphaBetaAgent", {"searchDriver": "mtdf", "ttSize": "100000"}),
+    ("ExpectimaxAgent", {}),
+    ("ExpectimaxAgent", {"starPruning": "star1"}),
+]
+
+
+def getLayoutNames(layoutDir="layouts"):
+    """
+    Returns the names of all .lay files in layoutDir, in sorted order.
+    """
+    return sorted(f[:-4] for f in os.listdir(layoutDir) if f.endswith(".lay"))
+
+
+def sampleStates(gameLayout, numStates, seed):
+    """
+    Returns numStates states with Pacman to move, collected along random
+    playouts from the layout's start.  A playout that ends is restarted.
+    """
+    rng = random.Random(seed)
+    start = GameState()
+    start.initialize(gameLayout, gameLayout.getNumGhosts())
+    numAgents = start.getNumAgents()
+
+    states = []
+    state = start
+    agentIndex = 0
+    while len(states) < numStates:
+        if state.isWin() or state.isLose():
+            state = start
+            agentIndex = 0
+        if agentIndex == 0:
+            states.append(state)
+        action = rng.choice(state.getLegalActions(agentIndex))
+        state = state.generateSuccessor(agentIndex, action)
+        agentIndex = (agentIndex + 1) % numAgents
+    return states
+
+
+def timeWorkload(workload, repeat):
+    """
+    Runs workload() once untimed to warm caches, then repeat more times, and
+    returns the fastest time in seconds together with workload's last result.
+    """
+    result = workload()
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = workload()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def makeResult(name, layoutName, seconds, calls, nodes=None):
+    result = {
+        "name": name,
+        "layout": layoutName,
+        "calls": calls,
+        "seconds": round(seconds, 9),
+        "usPerCall": round(seconds * 1e6 / calls, 3) if calls else None,
+    }
+    if nodes is not None:
+        result["nodes"] = nodes
+        result["nodesPerSecond"] = round(nodes / seconds, 1) if seconds else None
+    return result
+
+
+def benchmarkEngine(layoutName, states, repeat):
+    """
+    Times generateSuccessor and getLegalActions over the sample states.
+    """
+    results = []
+    moves = []
+    for state in states:
+        for agentIndex in range(state.getNumAgents()):
+            for action in state.getLegalActions(agentIndex):
+                moves.append((state, agentIndex, action))
+
+    def successors():
+        for state, agentIndex, action in moves:
+            state.generateSuccessor(agentIndex, action)
+        return len(moves)
+
+    seconds, calls = timeWorkload(successors, repeat)
+    results.append(makeResult("generateSuccessor", layoutName, seconds, calls))
+
+    def legalActions():
+        calls = 0
+        for state in states:
+            for agentIndex in range(state.getNumAgents()):
+                state.getLegalActions(agentIndex)
+                calls += 1
+        return calls
+
+    seconds, calls = timeWorkload(legalActions, repeat)
+    results.append(makeResult("getLegalActions", layoutName, seconds, calls))
+    return results
+
+
+def benchmarkEvaluation(layoutName, states, repeat):
+    """
+    Times each evaluation function over the sample states.
+    """
+    from algorithms import multi_agents
+
+    results = []
+    for name in EVALUATION_FUNCTIONS:
+        evaluate = getattr(multi_agents, name)
+
+        def evaluations():
+            for state in states:
+                evaluate(state)
+            return len(states)
+
+        seconds, calls = timeWorkload(evaluations, repeat)
+        results.append(makeResult("eval:" + name, layoutName, seconds, calls))
+    return results
+
+
+def benchmarkSearch(layoutName, states, depth, repeat, seed, evalFn):
+    """
+    Times full getAction calls of each search agent at a fixed depth over
+    the sample states, counting the nodes searched.
+    """
+    from algorithms import multi_agents
+
+    results = []
+    for agentName, options in SEARCH_AGENTS:
+        agentType = getattr(multi_agents, agentName)
+
+        def searches():
+            # A fresh agent and seed, so every run searches the same trees
+            random.seed(seed)
+            agent = agentType(evalFn=evalFn, depth=str(depth), **options)
+            nodes = 0
+            for state in states:
+                agent.getAction(state)
+                nodes += agent.nodesExpanded
+            return nodes
+
+        seconds, nodes = timeWorkload(searches, repeat)
+        name = agentName
+        if options:
+            settings = ["%s=%s" % item for item in sorted(options.items())]
+            name += "[%s]" % ",".join(settings)
+        name += "@%d" % depth
+        results.append(makeResult(name, layoutName, seconds, len(states), nodes))
+    return results
+
+
+def runBenchmarks(
+    layoutNames,
+    numStates=50,
+    numSearchStates=5,
+    depths=(2,),
+    repeat=3,
+    seed=0,
+    evalFn="betterEvaluationFunction",
+):
+    """
+    Runs every benchmark on each layout and returns the report dictionary.
+    Layouts that cannot be loaded are reported with an error instead.
+    """
+    results = []
+    errors = []
+    for layoutName in layoutNames:
+        try:
+            gameLayout = layout.getLayout(layoutName)
+        except Exception as e:
+            errors.append({"layout": layoutName, "error": str(e)})
+            continue
+        if gameLayout is None:
+            errors.append({"layout": layoutName, "error": "layout not found"})
+            continue
+
+        states = sampleStates(gameLayout, numStates, seed)
+        results.extend(benchmarkEngine(layoutName, states, repeat))
+        results.extend(benchmarkEvaluation(layoutName, states, repeat))
+        for depth in depths:
+            results.extend(
+                benchmarkSearch(
+                    layoutName, states[:numSearchStates], depth, repeat, seed, evalFn
+                )
+            )
+
+    return {
+        "settings": {
+            "numStates": numStates,
+            "numSearchStates": numSearchStates,
+            "depths": list(depths),
+            "repeat": repeat,
+            "seed": seed,
+            "evalFn": evalFn,
+        },
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+        "errors": errors,
+    }
+
+
+def compareReports(report, baseline, tolerance=0.1):
+    """
+    Compares the timings of report against baseline, benchmark by benchmark.
+    Returns (lines, regressions): a printable line per benchmark found in
+    both, and the number that got slower by more than tolerance.
+    """
+    old = {}
+    for result in baseline["results"]:
+        old[(result["name"], result["layout"])] = result
+
+    lines = []
+    regressions = 0
+    for result in report["results"]:
+        key = (result["name"], result["layout"])
+        if key not in old or not old[key]["seconds"]:
+            continue
+        if old[key]["calls"] != result["calls"]:
+            lines.append("%-40s %-16s workload changed" % key)
+            continue
+        ratio = result["seconds"] / old[key]["seconds"]
+        status = ""
+        if ratio > 1 + tolerance:
+            status = "SLOWER"
+            regressions += 1
+        elif ratio < 1 - tolerance:
+            status = "faster"
+        lines.append(
+            "%-40s %-16s %10.1fus %10.1fus %6.2fx %s"
+            % (
+                key[0],
+                key[1],
+                old[key]["usPerCall"],
+                result["usPerCall"],
+                ratio,
+                status,
+            )
+        )
+    return lines, regressions
+
+
+def readCommand(argv):
+    """
+    Processes the command used to run the benchmarks from the command line.
+    """
+    from optparse import OptionParser
+
+    usageStr = """
+    USAGE:      python -m core.benchmark <options>
+    EXAMPLES:   (1) python -m core.benchmark -o before.json
+                    - benchmarks every layout and saves the results
+                (2) python -m core.benchmark --baseline before.json
+                    - benchmarks again and compares against the saved results
+    """
+    parser = OptionParser(usageStr)
+
+    def default(helpStr):
+        return helpStr + " [Default: %default]"
+
+    parser.add_option(
+        "-l",
+        "--layouts",
+        dest="layouts",
+        help="Comma separated layouts to benchmark [Default: every .lay file]",
+        default=None,
+    )
+    parser.add_option(
+        "-n",
+        "--numStates",
+        type="int",
+        dest="numStates",
+        help=default("Sample states per layout for the engine benchmarks"),
+        default=50,
+    )
+    parser.add_option(
+        "--searchStates",
+        type="int",
+        dest="numSearchStates",
+        help=default("Sample states per layout for the getAction benchmarks"),
+        default=5,
+    )
+    parser.add_option(
+        "-d",
+        "--depths",
+        dest="depths",
+        help=default("Comma separated search depths"),
+        default="2",
+    )
+    parser.add_option(
+        "-r",
+        "--repeat",
+        type="int",
+        dest="repeat",
+        help=default("Timed runs of each benchmark; the fastest is kept"),
+        default=3,
+    )
+    parser.add_option(
+        "-s",
+        "--seed",
+        type="int",
+        dest="seed",
+        help=default("Seed of the sampling playouts and the agents"),
+        default=0,
+    )
+    parser.add_option(
+        "-e",
+        "--evalFn",
+        dest="evalFn",
+        help=default("Evaluation function of the search agents"),
+        default="betterEvaluationFunction",
+    )
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output",
+        help="File to write the JSON report to [Default: standard output]",
+        default=None,
+    )
+    parser.add_option(
+        "-b",
+        "--baseline",
+        dest="baseline",
+        help="JSON report of an earlier run to compare against",
+        default=None,
+    )
+    parser.add_option(
+        "-t",
+        "--tolerance",
+        type="float",
+        dest="tolerance",
+        help=default("Slowdown ratio above which a benchmark counts as a regression"),
+        default=0.1,
+    )
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception("Command line input not understood: " + str(otherjunk))
+    if options.layouts is None:
+        options.layouts = getLayoutNames()
+    else:
+        options.layouts = options.layouts.split(",")
+    options.depths = [int(d) for d in options.depths.split(",")]
+    return options
+
+
+if __name__ == "__main__":
+    options = readCommand(sys.argv[1:])
+    report = runBenchmarks(
+        options.layouts,
+        options.numStates,
+        options.numSearchStates,
+        options.depths,
+        options.repeat,
+        options.seed,
+        options.evalFn,
+    )
+
+    text = json.dumps(report, indent=2)
+    if options.output is None:
+        print(text)
+    else:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compareReports(report, baseline, options.tolerance)
+        for line in lines:
+            print(line, file=sys.stderr)
+        print(
+            "%d of %d benchmarks slower than the baseline" % (regressions, len(lines)),
+            file=sys.stderr,
+        )
+        if regressions > 0:
+            sys.exit(1)
@@ -2,6 +2,7 @@
 # -------
 
 from .util import *
+import random
 import time
 import traceback
 import sys
@@ -51,11 +52,17 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are never changed once made (moving creates a new one), so
+    agent states can share them and their hash is computed at most once.
     """
 
+    __slots__ = ("pos", "direction", "_hash")
+
     def __init__(self, pos, direction):
         self.pos = pos
         self.direction = direction
+        self._hash = None
 
     def getPosition(self):
         return self.pos
@@ -68,14 +75,16 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None:
+        if other is None:
             return False
         return self.pos == other.pos and self.direction == other.direction
 
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        if self._hash is None:
+            x = hash(self.pos)
+            y = hash(self.direction)
+            self._hash = hash(x + 13 * y)
+        return self._hash
 
     def __str__(self):
         return "(x,y)=" + str(self.pos) + ", " + str(self.direction)
@@ -101,6 +110,15 @@ class AgentState:
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
 
+    __slots__ = (
+        "start",
+        "configuration",
+        "isPacman",
+        "scaredTimer",
+        "numCarrying",
+        "numReturned",
+    )
+
     def __init__(self, startConfiguration, isPacman):
         self.start = startConfiguration
         self.configuration = startConfiguration
@@ -117,7 +135,7 @@ class AgentState:
             return "Ghost: " + str(self.configuration)
 
     def __eq__(self, other):
-        if other == None:
+        if other is None:
             return False
         return (
             self.configuration == other.configuration
@@ -128,7 +146,10 @@ class AgentState:
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy(self):
-        state = AgentState(self.start, self.isPacman)
+        # Skips __init__; every field is set below
+        state = AgentState.__new__(AgentState)
+        state.start = self.start
+        state.isPacman = self.isPacman
         state.configuration = self.configuration
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
@@ -136,7 +157,7 @@ class AgentState:
         return state
 
     def getPosition(self):
-        if self.configuration == None:
+        if self.configuration is None:
             return None
         return self.configuration.getPosition()
 
@@ -146,76 +167,113 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans backed by the bits of a single integer.
+    Data is accessed via grid[x][y] where (x,y) are positions on a Pacman map
+    with x horizontal, y vertical and the origin (0,0) in the bottom left corner.
+
+    Cell (x,y) is bit x * height + y of self.bits.  Because a Python int is
+    immutable, copying a grid is O(1), count() is a popcount and hashing or
+    comparing grids works on the integer directly.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
 
+    CELLS_PER_INT = 30
+
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]:
             raise Exception("Grids can only contain booleans")
-        self.CELLS_PER_INT = 30
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if not 0 <= i < self.width:
+            if -self.width <= i < 0:
+                i += self.width
+            else:
+                raise IndexError("grid index out of range")
+        return GridColumn(self, i)
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield GridColumn(self, x)
+
+    def __len__(self):
+        return self.width
 
     def __str__(self):
         out = [
-            [str(self.data[x][y])[0] for x in range(self.width)]
-            for y in range(self.height)
+            [str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)
         ]
         out.reverse()
         return "\n".join(["".join(x) for x in out])
 
     def __eq__(self, other):
-        if other == None:
+        if other is None:
             return False
-        return self.data == other.data
+        return (
+            self.bits == other.bits
+            and self.width == other.width
+            and self.height == other.height
+        )
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash(self.bits)
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g = Grid.__new__(Grid)
+        g.width = self.width
+        g.height = self.height
+        g.bits = self.bits
+        return g
+
+    def without(self, x, y):
+        """
+        Returns a copy of the grid with (x,y) False, leaving this one as it
+        is, so the states on a search stack keep their food when a successor
+        eats.
+        """
+        g = self.copy()
+        g.bits &= ~(1 << (x * self.height + y))
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        # The bits are immutable, so sharing them is the same as copying
+        return self.copy()
 
     def count(self, item=True):
-        return sum([x.count(item) for x in self.data])
+        numSet = self.bits.bit_count()
+        if item:
+            return numSet
+        return self.width * self.height - numSet
 
     def asList(self, key=True):
+        bits = self.bits
+        if not key:
+            bits ^= (1 << (self.width * self.height)) - 1
+        height = self.height
+        columnMask = (1 << height) - 1
         list = []
         for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key:
-                    list.append((x, y))
+            # Walk the set bits of one column at a time; small ints are cheap
+            column = bits & columnMask
+            bits >>= height
+            while column:
+                lowest = column & -column
+                list.append((x, lowest.bit_length() - 1))
+                column ^= lowest
         return list
 
     def packBits(self):
@@ -238,7 +296,7 @@ class Grid:
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -269,6 +327,49 @@ class Grid:
         return bools
 
 
+class GridColumn:
+    """
+    A view of one column of a Grid, so that grid[x][y] reads and writes the
+    grid's bits.
+    """
+
+    __slots__ = ("grid", "offset", "height")
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+        self.height = grid.height
+
+    def _bit(self, y):
+        if not 0 <= y < self.height:
+            if -self.height <= y < 0:
+                y += self.height
+            else:
+                raise IndexError("grid index out of range")
+        return 1 << (self.offset + y)
+
+    def __getitem__(self, y):
+        return self.grid.bits & self._bit(y) != 0
+
+    def __setitem__(self, y, value):
+        if value not in [False, True]:
+            raise Exception("Grids can only contain booleans")
+        if value:
+            self.grid.bits |= self._bit(y)
+        else:
+            self.grid.bits &= ~self._bit(y)
+
+    def __iter__(self):
+        for y in range(self.height):
+            yield self[y]
+
+    def __len__(self):
+        return self.height
+
+    def count(self, item=True):
+        return sum(1 for cell in self if cell == item)
+
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1, 2)):
         return bitRep
@@ -384,18 +485,72 @@ class Actions:
     getSuccessor = staticmethod(getSuccessor)
 
 
+class ZobristKeys:
+    """
+    Random 64-bit keys for the features of a game state, drawn the first time
+    each feature is seen.  XOR-ing the keys of every feature present gives a
+    Zobrist hash that can be updated in O(1) when a feature changes.
+
+    Keys are only stable within one process.
+    """
+
+    def __init__(self, seed=188):
+        self.random = random.Random(seed)
+        self.keys = {}
+
+    def key(self, feature):
+        value = self.keys.get(feature)
+        if value is None:
+            value = self.keys[feature] = self.random.getrandbits(64)
+        return value
+
+    def agentKey(self, agentIndex, agentState):
+        configuration = agentState.configuration
+        return self.key(
+            (
+                "agent",
+                agentIndex,
+                configuration.pos,
+                configuration.direction,
+                agentState.scaredTimer,
+            )
+        )
+
+    def foodKey(self, position):
+        return self.key(("food", position))
+
+    def capsuleKey(self, position):
+        return self.key(("capsule", position))
+
+    def scoreKey(self, score):
+        return self.key(("score", score))
+
+
+ZOBRIST = ZobristKeys()
+
+
 class GameStateData:
     def __init__(self, prevState=None):
         """
         Generates a new data packet by copying information from its predecessor.
         """
-        if prevState != None:
-            self.food = prevState.food.shallowCopy()
+        if prevState is not None:
+            # Its own Grid, so writes to it stay in this state; the bits are
+            # shared, so this is O(1)
+            self.food = prevState.food.copy()
+            self.numFood = prevState.numFood
             self.capsules = prevState.capsules[:]
             self.agentStates = self.copyAgentStates(prevState.agentStates)
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            # Never mutated in place, so the lists can be shared
+            self._zobrist = prevState._zobrist
+            self._agentKeys = prevState._agentKeys
+            # Depend only on Pacman's position, the food and the capsules, so
+            # they carry over until Pacman moves (see GameState.getFoodFeatures)
+            self._features = prevState._features
+            self._featureHint = prevState._featureHint
 
         self._foodEaten = None
         self._foodAdded = None
@@ -406,26 +561,68 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy(self):
+        # The layout is never changed in place, so the copy made by
+        # GameStateData(self) can share it; the food grid is copied there
         state = GameStateData(self)
-        state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def computeZobrist(self):
+        """
+        Computes the Zobrist key of the food, capsules and agents from scratch.
+        The score is mixed in by zobrist().
+        """
+        key = 0
+        for position in self.food.asList():
+            key ^= ZOBRIST.foodKey(position)
+        for position in self.capsules:
+            key ^= ZOBRIST.capsuleKey(position)
+        for agentKey in self._agentKeys:
+            key ^= agentKey
+        return key
+
+    def resetZobrist(self):
+        """
+        Recomputes the Zobrist key after the data was set up directly.
+        """
+        self._agentKeys = [
+            ZOBRIST.agentKey(index, agentState)
+            for index, agentState in enumerate(self.agentStates)
+        ]
+        self._zobrist = self.computeZobrist()
+
+    def refreshAgentKeys(self, agentIndices):
+        """
+        Folds changes to the listed agents into the Zobrist key.
+        """
+        agentKeys = self._agentKeys
+        for index in agentIndices:
+            newKey = ZOBRIST.agentKey(index, self.agentStates[index])
+            oldKey = agentKeys[index]
+            if newKey != oldKey:
+                if agentKeys is self._agentKeys:
+                    agentKeys = agentKeys[:]
+                agentKeys[index] = newKey
+                self._zobrist ^= oldKey ^ newKey
+        self._agentKeys = agentKeys
+
+    def zobrist(self):
+        """
+        Returns a 64-bit key that is equal for equal states (see __eq__).
+        """
+        return self._zobrist ^ ZOBRIST.scoreKey(self.score)
+
     def copyAgentStates(self, agentStates):
-        copiedStates = []
-        for agentState in agentStates:
-            copiedStates.append(agentState.copy())
-        return copiedStates
+        return [agentState.copy() for agentState in agentStates]
 
     def __eq__(self, other):
         """
         Allows two states to be compared.
         """
-        if other == None:
+        if other is None:
             return False
         # TODO Check for type of other
         if not self.agentStates == other.agentStates:
@@ -442,36 +639,22 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int(
-            (
-                hash(tuple(self.agentStates))
-                + 13 * hash(self.food)
-                + 113 * hash(tuple(self.capsules))
-                + 7 * hash(self.score)
-            )
-            % 1048575
-        )
+        return hash(self.zobrist())
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
         if type(self.food) == type((1, 2)):
             self.food = reconstituteGrid(self.food)
-        for x in range(width):
-            for y in range(height):
-                food, walls = self.food, self.layout.walls
-                map[x][y] = self._foodWallStr(food[x][y], walls[x][y])
+        food, walls = self.food, self.layout.walls
+        map = [
+            [self._foodWallStr(food[x][y], walls[x][y]) for y in range(height)]
+            for x in range(width)
+        ]
 
         for agentState in self.agentStates:
-            if agentState == None:
+            if agentState is None:
                 continue
-            if agentState.configuration == None:
+            if agentState.configuration is None:
                 continue
             x, y = [int(i) for i in nearestPoint(agentState.configuration.pos)]
             agent_dir = agentState.configuration.direction
@@ -483,7 +666,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = "o"
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = ["".join(map[x][y] for x in range(width)) for y in range(height)]
+        rows.reverse()
+        return "\n".join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr(self, hasFood, hasWall):
         if hasFood:
@@ -517,6 +702,7 @@ class GameStateData:
         Creates an initial game state from a layout array (see layout.py).
         """
         self.food = layout.food.copy()
+        self.numFood = self.food.count()  # Kept up to date as food is eaten
         # self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -535,6 +721,9 @@ class GameStateData:
                 AgentState(Configuration(pos, Directions.STOP), isPacman)
             )
         self._eaten = [False for a in self.agentStates]
+        self._features = {}
+        self._featureHint = None
+        self.resetZobrist()
 
 
 try:
@@ -761,7 +950,9 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.totalAgentTimes[agentIndex] += time.time() - start_time
             self.unmute()
 
             # Execute the action
@@ -3,17 +3,35 @@
 
 
 from .util import manhattanDistance
+from .util import nearestPoint
 from .game import Grid
+from .game import Actions
+from .game import Configuration
+from .game import Directions
+from array import array
+import hashlib
+import heapq
+import math
 import os
 import random
+import sys
 from functools import reduce
 
 VISIBILITY_MATRIX_CACHE = {}
+MAZE_DISTANCE_CACHE = {}
+
+# Where maze distance tables are saved between runs
+DISTANCE_CACHE_DIR = os.environ.get(
+    "PACMAN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ai-pacman")
+)
 
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are not changed once built, so every GameState of a game shares
+    one; use deepCopy for an independent copy.
     """
 
     def __init__(self, layoutText):
@@ -27,6 +45,10 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.mazeDistances = None  # Computed on first use
+        self.junctionGraph = None  # Built on first use
+        self.foodIndexes = {}  # Built on first use
+        self.buildActionTables()
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -73,6 +95,90 @@ class Layout:
                 reduce(str.__add__, self.layoutText)
             ]
 
+    def buildActionTables(self):
+        """
+        Precomputes the legal moves of agents standing on a grid point:
+
+          pacmanActions[(x, y)]          - Pacman's legal actions at (x, y)
+          ghostActions[((x, y), heading)] - a ghost's legal actions at (x, y)
+                                            when it last moved in heading
+
+        The entries are tuples shared by every caller.  Cells on the open
+        border of a maze have no entry, nor do the half-way points of scared
+        ghosts; the rules compute those the slow way.
+        """
+        self.pacmanActions = {}
+        self.ghostActions = {}
+        headings = list(Directions.REVERSE.keys())
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x][y]:
+                    continue
+                stopped = Configuration((x, y), Directions.STOP)
+                try:
+                    possible = Actions.getPossibleActions(stopped, self.walls)
+                except IndexError:
+                    continue
+                self.pacmanActions[(x, y)] = tuple(possible)
+
+                # Ghosts cannot stop, nor turn around unless at a dead end
+                moves = [action for action in possible if action != Directions.STOP]
+                for heading in headings:
+                    reverse = Actions.reverseDirection(heading)
+                    if reverse in moves and len(moves) > 1:
+                        legal = [action for action in moves if action != reverse]
+                    else:
+                        legal = moves
+                    self.ghostActions[((x, y), heading)] = tuple(legal)
+
+    def getLayoutHash(self):
+        """
+        Returns a digest of the layout text, which identifies the maze.
+        """
+        return hashlib.sha1("\n".join(self.layoutText).encode()).hexdigest()
+
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances of this maze.  They are computed once per
+        layout text and saved in DISTANCE_CACHE_DIR, so later processes load
+        them instead of searching again.
+        """
+        if self.mazeDistances is None:
+            layoutHash = self.getLayoutHash()
+            if layoutHash not in MAZE_DISTANCE_CACHE:
+                MAZE_DISTANCE_CACHE[layoutHash] = MazeDistances(self.walls, layoutHash)
+            self.mazeDistances = MAZE_DISTANCE_CACHE[layoutHash]
+        return self.mazeDistances
+
+    def getJunctionGraph(self):
+        """
+        Returns the JunctionGraph of this maze, built on first use.
+        """
+        if self.junctionGraph is None:
+            self.junctionGraph = JunctionGraph(self)
+        return self.junctionGraph
+
+    def getFoodIndex(self, distance):
+        """
+        Returns the FoodIndex of this maze for distance, which must be
+        manhattanDistance or the getDistance of getMazeDistances(); returns
+        None for any other distance function.
+        """
+        if distance is manhattanDistance:
+            key = "manhattan"
+        elif (
+            self.mazeDistances is not None
+            and getattr(distance, "__self__", None) is self.mazeDistances
+            and getattr(distance, "__func__", None) is MazeDistances.getDistance
+        ):
+            key = "maze"
+        else:
+            return None
+        index = self.foodIndexes.get(key)
+        if index is None:
+            index = self.foodIndexes[key] = FoodIndex(self.walls, distance)
+        return index
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -152,6 +258,370 @@ class Layout:
             self.numGhosts += 1
 
 
+class MazeDistances:
+    """
+    Shortest path lengths between every pair of non-wall cells of a maze.
+
+    Cells are numbered column by column; the lengths are kept in one flat
+    array of unsigned shorts, so a lookup is two dict probes and an index.
+    Positions between grid points (scared ghosts) are rounded to the nearest
+    cell.  Cells that cannot reach each other are math.inf apart.
+    """
+
+    UNREACHABLE = 0xFFFF
+    FILE_MAGIC = b"PMD1"
+
+    def __init__(self, walls, layoutHash=None):
+        self.cells = walls.asList(False)
+        self.cellIndex = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.numCells = len(self.cells)
+        self.distances = None
+        if layoutHash is not None:
+            self.distances = self._load(layoutHash)
+        if self.distances is None:
+            self.distances = self._computeDistances(walls)
+            if layoutHash is not None:
+                self._save(layoutHash)
+
+    def getDistance(self, pos1, pos2):
+        i = self.cellIndex.get(pos1)
+        if i is None:
+            i = self.cellIndex[nearestPoint(pos1)]
+        j = self.cellIndex.get(pos2)
+        if j is None:
+            j = self.cellIndex[nearestPoint(pos2)]
+        distance = self.distances[i * self.numCells + j]
+        if distance == self.UNREACHABLE:
+            return math.inf
+        return distance
+
+    def _computeDistances(self, walls):
+        """
+        Runs a breadth first search from every cell.
+        """
+        n = self.numCells
+        neighbors = []
+        for x, y in self.cells:
+            neighbors.append(
+                [
+                    self.cellIndex[cell]
+                    for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                    if cell in self.cellIndex
+                ]
+            )
+
+        distances = array("H", [self.UNREACHABLE]) * (n * n)
+        for source in range(n):
+            row = source * n
+            distances[row + source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[cell]:
+                        if distances[row + neighbor] == self.UNREACHABLE:
+                            distances[row + neighbor] = distance
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+        return distances
+
+    def _cachePath(self, layoutHash):
+        return os.path.join(DISTANCE_CACHE_DIR, layoutHash + ".dist")
+
+    def _load(self, layoutHash):
+        try:
+            with open(self._cachePath(layoutHash), "rb") as f:
+                if f.read(len(self.FILE_MAGIC)) != self.FILE_MAGIC:
+                    return None
+                distances = array("H")
+                distances.frombytes(f.read())
+        except (OSError, ValueError):
+            return None
+        if len(distances) != self.numCells * self.numCells:
+            return None
+        if sys.byteorder == "big":
+            distances.byteswap()  # Saved little endian
+        return distances
+
+    def _save(self, layoutHash):
+        """
+        Saves the table for later runs.  Failing to save is not an error.
+        """
+        distances = self.distances
+        if sys.byteorder == "big":
+            distances = array("H", distances)
+            distances.byteswap()
+        path = self._cachePath(layoutHash)
+        tmpPath = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(DISTANCE_CACHE_DIR, exist_ok=True)
+            with open(tmpPath, "wb") as f:
+                f.write(self.FILE_MAGIC)
+                f.write(distances.tobytes())
+            os.replace(tmpPath, path)
+        except OSError:
+            pass
+
+
+class FoodIndex:
+    """
+    Finds the food nearest to a cell of a maze, for one distance function.
+
+    For every cell it keeps the masks of the open cells at each distance
+    from it (rings), in the bit layout of Grid.bits; a cell's rings are
+    built the first time it is asked about.  The nearest food is then in the
+    first ring that meets the food grid's bits, which takes one and per
+    ring.  Eating needs no update, since the index never holds the food:
+    each query reads the grid it is given.
+    """
+
+    def __init__(self, walls, distance):
+        self.height = walls.height
+        self.cells = walls.asList(False)
+        self.distance = distance
+        self.rings = {}
+
+    def getRings(self, pos):
+        """
+        Returns the list of masks of the cells at distance 0, 1, 2, ... from
+        pos.  Cells that cannot be reached from pos are in none of them.
+        """
+        rings = self.rings.get(pos)
+        if rings is None:
+            pos = nearestPoint(pos)
+            rings = self.rings.get(pos)
+            if rings is None:
+                rings = self.rings[pos] = self._computeRings(pos)
+        return rings
+
+    def _computeRings(self, pos):
+        rings = []
+        height = self.height
+        for cell in self.cells:
+            distance = self.distance(pos, cell)
+            if distance == math.inf:
+                continue
+            while len(rings) <= distance:
+                rings.append(0)
+            rings[distance] |= 1 << (cell[0] * height + cell[1])
+        return rings
+
+    def getClosestDistance(self, pos, food, lowest=0):
+        """
+        Returns the distance from pos to the nearest food of the Grid food,
+        None if there is no food and math.inf if none can be reached.  The
+        search starts at distance lowest, which must not be past the answer.
+        """
+        bits = food.bits
+        if not bits:
+            return None
+        rings = self.getRings(pos)
+        for distance in range(max(lowest, 0), len(rings)):
+            if bits & rings[distance]:
+                return distance
+        return math.inf
+
+    def getClosest(self, pos, food, count=1):
+        """
+        Returns (distance, cell) pairs of the count pellets of food nearest
+        to pos, nearest first.  Pellets equally far are in Grid.asList order.
+        """
+        found = []
+        bits = food.bits
+        height = self.height
+        if count <= 0 or not bits:
+            return found
+        for distance, ring in enumerate(self.getRings(pos)):
+            hits = bits & ring
+            while hits:
+                lowest = hits & -hits
+                index = lowest.bit_length() - 1
+                found.append((distance, (index // height, index % height)))
+                if len(found) == count:
+                    return found
+                hits ^= lowest
+        return found
+
+
+class Corridor:
+    """
+    The way from one junction of a JunctionGraph to the next, walked in one
+    direction.
+
+    cells are the cells entered on the way, the last being the junction end,
+    and actions the moves that enter them, so length is the number of moves.
+    mask has the bits of cells in a Grid of the maze (see Grid.bits), which
+    counts the food on the way with a single and.  reverse is the same
+    corridor walked the other way.
+    """
+
+    __slots__ = ("start", "end", "cells", "actions", "length", "mask", "reverse")
+
+    def __init__(self, start, cells, actions, height):
+        self.start = start
+        self.end = cells[-1]
+        self.cells = tuple(cells)
+        self.actions = tuple(actions)
+        self.length = len(self.cells)
+        self.mask = 0
+        for x, y in self.cells:
+            self.mask |= 1 << (x * height + y)
+        self.reverse = None
+
+    def foodCount(self, food):
+        """
+        Returns the number of food pellets on the corridor's cells.
+        """
+        return (food.bits & self.mask).bit_count()
+
+    def getFood(self, food, offset=0):
+        """
+        Returns the cells with food met walking the corridor from its
+        offset-th move on, in the order they are met.
+        """
+        return [(x, y) for x, y in self.cells[offset:] if food[x][y]]
+
+    def __str__(self):
+        return "%s -> %s (%d)" % (self.start, self.end, self.length)
+
+
+class JunctionGraph:
+    """
+    A maze with its corridors compressed away.
+
+    Junctions are the cells with other than two open neighbours: crossings,
+    forks and dead ends.  Every other cell lies inside a corridor between
+    two junctions, so a search can step from junction to junction instead
+    of cell to cell.  A loop of the maze with no junction on it gets one of
+    its cells as a junction.
+
+    The ways out of a cell are (corridor, offset) pairs: walking
+    corridor.actions[offset:] from the cell leads to corridor.end.  Cells on
+    the open border of a maze are left out, as in Layout.buildActionTables.
+    """
+
+    def __init__(self, layout):
+        moves = {}
+        for cell, actions in layout.pacmanActions.items():
+            moves[cell] = []
+            for action in actions:
+                if action == Directions.STOP:
+                    continue
+                dx, dy = Actions.directionToVector(action)
+                neighbor = (int(cell[0] + dx), int(cell[1] + dy))
+                if neighbor in layout.pacmanActions:
+                    moves[cell].append((action, neighbor))
+
+        self.height = layout.height
+        self.numCells = len(moves)
+        self.corridors = {}
+        self.cellExits = {}
+        junctions = [cell for cell in sorted(moves) if len(moves[cell]) != 2]
+        for junction in junctions:
+            self.corridors[junction] = []
+        for junction in junctions:
+            self._buildCorridors(junction, moves)
+        for cell in sorted(moves):
+            if cell not in self.corridors and cell not in self.cellExits:
+                # A loop without junctions
+                self.corridors[cell] = []
+                self._buildCorridors(cell, moves)
+        self.junctions = sorted(self.corridors)
+
+    def _buildCorridors(self, junction, moves):
+        """
+        Walks every corridor leaving junction that is not built yet, and
+        builds it together with its reverse.
+        """
+        for action, cell in moves[junction]:
+            built = self.corridors[junction]
+            if any(corridor.actions[0] == action for corridor in built):
+                continue
+            cells = [cell]
+            actions = [action]
+            previous = junction
+            while cell not in self.corridors:
+                for action, neighbor in moves[cell]:
+                    if neighbor != previous:
+                        break
+                previous = cell
+                cell = neighbor
+                cells.append(cell)
+                actions.append(action)
+
+            corridor = Corridor(junction, cells, actions, self.height)
+            back = [Actions.reverseDirection(action) for action in reversed(actions)]
+            reverse = Corridor(cell, cells[-2::-1] + [junction], back, self.height)
+            corridor.reverse = reverse
+            reverse.reverse = corridor
+            self.corridors[junction].append(corridor)
+            self.corridors[cell].append(reverse)
+            for i, inner in enumerate(cells[:-1]):
+                self.cellExits[inner] = (
+                    (corridor, i + 1),
+                    (reverse, corridor.length - 1 - i),
+                )
+
+    def isJunction(self, cell):
+        return cell in self.corridors
+
+    def getCorridors(self, junction):
+        """
+        Returns the corridors leaving junction.
+        """
+        return self.corridors[junction]
+
+    def getExits(self, cell):
+        """
+        Returns the (corridor, offset) ways out of cell: one per corridor
+        leaving a junction, or both ends of the corridor cell lies in.
+        """
+        if cell in self.corridors:
+            return [(corridor, 0) for corridor in self.corridors[cell]]
+        return self.cellExits.get(cell, ())
+
+    def getDistance(self, source, target):
+        """
+        Returns the length of the shortest path from source to target, found
+        by Dijkstra's algorithm over the junctions.  MazeDistances answers
+        the same question from a table of every pair of cells.
+        """
+        if source == target:
+            return 0
+        best = math.inf
+        toTarget = {target: 0}
+        if target not in self.corridors:
+            for corridor, offset in self.getExits(target):
+                # Walking back from corridor.end reaches target
+                toTarget[corridor.end] = corridor.length - offset
+
+        distances = {}
+        frontier = [(0, source)]
+        if source not in self.corridors:
+            frontier = []
+            for corridor, offset in self.getExits(source):
+                if target in corridor.cells[offset:]:
+                    steps = corridor.cells.index(target, offset) + 1 - offset
+                    best = min(best, steps)
+                heapq.heappush(frontier, (corridor.length - offset, corridor.end))
+
+        while frontier:
+            distance, junction = heapq.heappop(frontier)
+            if distance >= best:
+                break
+            if junction in distances:
+                continue
+            distances[junction] = distance
+            if junction in toTarget:
+                best = min(best, distance + toTarget[junction])
+            for corridor in self.corridors[junction]:
+                if corridor.end not in distances:
+                    heapq.heappush(frontier, (distance + corridor.length, corridor.end))
+        return best
+
+
 def getLayout(name, back=2):
     if name.endswith(".lay"):
         layout = tryToLoad("layouts/" + name)
@@ -0,0 +1,471 @@
+# lockstep.py
+# -----------
+
+
+"""
+Plays many games of one layout at once, in lockstep, for evaluations that
+need far more games than core.batch can play through Game.run.
+
+The games are kept as parallel lists indexed by game instead of GameState
+objects: Pacman's cell and heading, each ghost's position (in half cells, so
+scared ghosts stay on integers), heading and scared timer, each game's food
+as the bits of a Grid, its capsules, score and move count.  Every tick moves
+one agent in every game still running, with the rules of PacmanRules and
+GhostRules and the move tables of the Layout.  Ghost policies are the
+RandomGhost and DirectionalGhost of ghostAgents.py, and Pacman's the
+LeftTurnAgent and GreedyAgent of agents/pacmanAgents.py.
+
+A game plays exactly as core.batch plays it with the same layout, agents and
+seed: each game draws from its own random.Random(seed) the numbers Game.run
+would draw from the random module after random.seed(seed).
+
+  > python -m core.lockstep -l mediumClassic -p GreedyAgent -g DirectionalGhost \\
+        --seeds 0-999
+"""
+
+import random
+import sys
+
+from . import layout
+from . import util
+from .game import Actions
+from .game import Configuration
+from .game import Directions
+from .pacman import (
+    TIME_PENALTY,
+    FOOD_SCORE,
+    GHOST_SCORE,
+    WIN_SCORE,
+    LOSE_PENALTY,
+    SCARED_TIME,
+)
+
+PACMAN_POLICIES = ("GreedyAgent", "LeftTurnAgent")
+GHOST_POLICIES = ("RandomGhost", "DirectionalGhost")
+
+# DirectionalGhost's default probabilities of its best moves
+PROB_ATTACK = 0.8
+PROB_SCARED_FLEE = 0.8
+
+RUNNING, WON, LOST = 0, 1, 2
+
+
+def sampleTable(distribution):
+    """
+    Returns (actions, cumulative probabilities) for a Counter of ghost
+    moves, with the same floating point sums util.sample works with, so
+    that the first cumulative total at or above random.random() picks the
+    move util.sample would.
+    """
+    items = sorted(distribution.items())
+    probabilities = [item[1] for item in items]
+    actions = [item[0] for item in items]
+    if sum(probabilities) != 1:
+        probabilities = util.normalize(probabilities)
+    totals = []
+    total = probabilities[0]
+    totals.append(total)
+    for probability in probabilities[1:]:
+        total += probability
+        totals.append(total)
+    return actions, totals
+
+
+class LockstepSimulator:
+    """
+    Plays games of gameLayout between a Pacman policy and ghost policy
+    named as agent classes, one game per seed.  numGhosts caps the ghosts as
+    in core.batch.  Games still running after maxMoves Pacman moves are
+    stopped unfinished; 0 plays every game to its end.  With recordMoves
+    each result keeps the game's move history, in the form of
+    Game.moveHistory.
+    """
+
+    def __init__(
+        self,
+        gameLayout,
+        pacman="GreedyAgent",
+        ghost="RandomGhost",
+        numGhosts=4,
+        maxMoves=0,
+        recordMoves=False,
+    ):
+        if pacman not in PACMAN_POLICIES:
+            raise ValueError("Pacman policy not supported: " + str(pacman))
+        if ghost not in GHOST_POLICIES:
+            raise ValueError("Ghost policy not supported: " + str(ghost))
+        self.layout = gameLayout
+        self.pacman = pacman
+        self.ghost = ghost
+        self.maxMoves = maxMoves
+        self.recordMoves = recordMoves
+        self.height = gameLayout.height
+
+        self.ghostStarts = []
+        pacmanStart = None
+        for isPacman, pos in gameLayout.agentPositions:
+            if isPacman:
+                pacmanStart = pos
+            elif len(self.ghostStarts) < numGhosts:
+                self.ghostStarts.append((2 * pos[0], 2 * pos[1]))
+        self.pacmanStart = pacmanStart
+        self.numGhosts = len(self.ghostStarts)
+
+        # Sample tables of ghost move distributions, built on first use
+        self.sampleTables = {}
+
+    def run(self, seeds):
+        """
+        Plays one game per seed and returns their result dictionaries, in
+        the order of seeds.
+        """
+        seeds = list(seeds)
+        n = len(seeds)
+        numGhosts = self.numGhosts
+        self.rngs = [random.Random(seed) for seed in seeds]
+        self.pacmanPos = [self.pacmanStart] * n
+        self.pacmanDir = [Directions.STOP] * n
+        self.ghostPos = [list(self.ghostStarts) for i in range(n)]
+        self.ghostDir = [[Directions.STOP] * numGhosts for i in range(n)]
+        self.scared = [[0] * numGhosts for i in range(n)]
+        self.food = [self.layout.food.bits] * n
+        self.numFood = [self.layout.totalFood] * n
+        self.capsules = [tuple(self.layout.capsules)] * n
+        self.scores = [0] * n
+        self.moves = [0] * n
+        self.status = [RUNNING] * n
+        self.histories = [[] for i in range(n)] if self.recordMoves else None
+
+        running = list(range(n))
+        while running:
+            for game in running:
+                self.movePacman(game)
+            for index in range(numGhosts):
+                for game in running:
+                    if self.status[game] == RUNNING:
+                        self.moveGhost(game, index)
+            running = [game for game in running if self.status[game] == RUNNING]
+            if self.maxMoves > 0:
+                running = [game for game in running if self.moves[game] < self.maxMoves]
+
+        results = []
+        for game, seed in enumerate(seeds):
+            result = {
+                "seed": seed,
+                "pacman": self.pacman,
+                "ghost": self.ghost,
+                "score": self.scores[game],
+                "win": self.status[game] == WON,
+                "moves": self.moves[game],
+                "finished": self.status[game] != RUNNING,
+            }
+            if self.recordMoves:
+                result["moveHistory"] = self.histories[game]
+            results.append(result)
+        return results
+
+    def pacmanOutcome(self, game, action):
+        """
+        Returns (position, score change, status, eaten ghosts, capsule) of
+        Pacman playing action in game, without changing the game.
+        """
+        x, y = self.pacmanPos[game]
+        dx, dy = Actions._directions[action]
+        x, y = x + dx, y + dy
+        change = -TIME_PENALTY
+        status = RUNNING
+
+        bit = 1 << (x * self.height + y)
+        if self.food[game] & bit:
+            change += FOOD_SCORE
+            if self.numFood[game] == 1:
+                change += WIN_SCORE
+                status = WON
+        capsule = (x, y) in self.capsules[game]
+
+        eaten = []
+        px, py = 2 * x, 2 * y
+        scared = self.scared[game]
+        for index, (gx, gy) in enumerate(self.ghostPos[game]):
+            if abs(gx - px) + abs(gy - py) <= 1:
+                if capsule or scared[index] > 0:
+                    change += GHOST_SCORE
+                    eaten.append(index)
+                elif status != WON:
+                    change -= LOSE_PENALTY
+                    status = LOST
+        return (x, y), change, status, eaten, capsule
+
+    def pacmanLegalActions(self, game):
+        position = self.pacmanPos[game]
+        actions = self.layout.pacmanActions.get(position)
+        if actions is None:
+            conf = Configuration(position, self.pacmanDir[game])
+            actions = tuple(Actions.getPossibleActions(conf, self.layout.walls))
+        return actions
+
+    def choosePacmanAction(self, game):
+        legal = self.pacmanLegalActions(game)
+        if self.pacman == "LeftTurnAgent":
+            current = self.pacmanDir[game]
+            if current == Directions.STOP:
+                current = Directions.NORTH
+            left = Directions.LEFT[current]
+            if left in legal:
+                return left
+            if current in legal:
+                return current
+            if Directions.RIGHT[current] in legal:
+                return Directions.RIGHT[current]
+            if Directions.LEFT[left] in legal:
+                return Directions.LEFT[left]
+            return Directions.STOP
+
+        # GreedyAgent with scoreEvaluation
+        score = self.scores[game]
+        scored = [
+            (score + self.pacmanOutcome(game, action)[1], action)
+            for action in legal
+            if action != Directions.STOP
+        ]
+        bestScore = max(scored)[0]
+        bestActions = [pair[1] for pair in scored if pair[0] == bestScore]
+        return self.rngs[game].choice(bestActions)
+
+    def movePacman(self, game):
+        action = self.choosePacmanAction(game)
+        if self.recordMoves:
+            self.histories[game].append((0, action))
+        position, change, status, eaten, capsule = self.pacmanOutcome(game, action)
+
+        self.pacmanPos[game] = position
+        if action != Directions.STOP:
+            self.pacmanDir[game] = action
+        bit = 1 << (position[0] * self.height + position[1])
+        if self.food[game] & bit:
+            self.food[game] ^= bit
+            self.numFood[game] -= 1
+        if capsule:
+            self.capsules[game] = tuple(c for c in self.capsules[game] if c != position)
+            self.scared[game] = [SCARED_TIME] * self.numGhosts
+        if eaten:
+            for index in eaten:
+                self.ghostPos[game][index] = self.ghostStarts[index]
+                self.ghostDir[game][index] = Directions.STOP
+                self.scared[game][index] = 0
+
+        self.scores[game] += change
+        self.status[game] = status
+        self.moves[game] += 1
+
+    def ghostLegalActions(self, game, index):
+        gx, gy = self.ghostPos[game][index]
+        direction = self.ghostDir[game][index]
+        if gx % 2 or gy % 2:
+            # Scared ghosts between grid points keep going
+            return (direction,)
+        actions = self.layout.ghostActions.get(((gx // 2, gy // 2), direction))
+        if actions is None:
+            conf = Configuration((gx // 2, gy // 2), direction)
+            actions = Actions.getPossibleActions(conf, self.layout.walls)
+            actions = [action for action in actions if action != Directions.STOP]
+            reverse = Actions.reverseDirection(direction)
+            if reverse in actions and len(actions) > 1:
+                actions.remove(reverse)
+            actions = tuple(actions)
+        return actions
+
+    def ghostSampleTable(self, legal, best, isScared):
+        """
+        Returns the sample table of the ghost policy's distribution over
+        legal, built the way ghostAgents.py builds it.
+        """
+        key = (legal, best, isScared)
+        table = self.sampleTables.get(key)
+        if table is None:
+            dist = util.Counter()
+            if self.ghost == "RandomGhost":
+                for a in legal:
+                    dist[a] = 1.0
+            else:
+                bestProb = PROB_SCARED_FLEE if isScared else PROB_ATTACK
+                for a in best:
+                    dist[a] = bestProb / len(best)
+                for a in legal:
+                    dist[a] += (1 - bestProb) / len(legal)
+            dist.normalize()
+            table = self.sampleTables[key] = sampleTable(dist)
+        return table
+
+    def moveGhost(self, game, index):
+        legal = self.ghostLegalActions(game, index)
+        gx, gy = self.ghostPos[game][index]
+        timer = self.scared[game][index]
+        isScared = timer > 0
+        step = 1 if isScared else 2
+
+        best = ()
+        if self.ghost == "DirectionalGhost":
+            px, py = self.pacmanPos[game]
+            px, py = 2 * px, 2 * py
+            distances = []
+            for action in legal:
+                dx, dy = Actions._directions[action]
+                distances.append(abs(gx + dx * step - px) + abs(gy + dy * step - py))
+            bestScore = max(distances) if isScared else min(distances)
+            best = tuple(
+                action
+                for action, distance in zip(legal, distances)
+                if distance == bestScore
+            )
+        actions, totals = self.ghostSampleTable(legal, best, isScared)
+        choice = self.rngs[game].random()
+        i = 0
+        while choice > totals[i]:
+            i += 1
+        action = actions[i]
+        if self.recordMoves:
+            self.histories[game].append((index + 1, action))
+
+        dx, dy = Actions._directions[action]
+        gx, gy = gx + dx * step, gy + dy * step
+        if timer == 1:
+            # Back on the grid when the scare ends
+            gx, gy = (gx + 1) // 2 * 2, (gy + 1) // 2 * 2
+        timer = max(0, timer - 1)
+
+        ghostDir = self.ghostDir[game]
+        ghostDir[index] = action
+        px, py = self.pacmanPos[game]
+        if abs(gx - 2 * px) + abs(gy - 2 * py) <= 1:
+            if timer > 0:
+                self.scores[game] += GHOST_SCORE
+                gx, gy = self.ghostStarts[index]
+                ghostDir[index] = Directions.STOP
+                timer = 0
+            else:
+                self.scores[game] -= LOSE_PENALTY
+                self.status[game] = LOST
+        self.ghostPos[game][index] = (gx, gy)
+        self.scared[game][index] = timer
+
+
+def runLockstep(
+    layoutName,
+    seeds,
+    pacman="GreedyAgent",
+    ghost="RandomGhost",
+    numGhosts=4,
+    maxMoves=0,
+):
+    """
+    Plays one game per seed on the named layout and returns the results.
+    """
+    gameLayout = layout.getLayout(layoutName)
+    if gameLayout is None:
+        raise Exception("The layout " + layoutName + " cannot be found")
+    simulator = LockstepSimulator(gameLayout, pacman, ghost, numGhosts, maxMoves)
+    results = simulator.run(seeds)
+    for result in results:
+        result["layout"] = layoutName
+    return results
+
+
+def readCommand(argv):
+    """
+    Processes the command used to run the simulator from the command line.
+    """
+    from optparse import OptionParser
+
+    usageStr = """
+    USAGE:      python -m core.lockstep <options>
+    EXAMPLES:   (1) python -m core.lockstep -l smallClassic --seeds 0-9999
+                    - plays 10000 games of GreedyAgent against RandomGhost
+    """
+    parser = OptionParser(usageStr)
+
+    def default(helpStr):
+        return helpStr + " [Default: %default]"
+
+    parser.add_option(
+        "-l",
+        "--layout",
+        dest="layout",
+        help=default("the LAYOUT_FILE from which to load the map layout"),
+        metavar="LAYOUT_FILE",
+        default="mediumClassic",
+    )
+    parser.add_option(
+        "-p",
+        "--pacman",
+        dest="pacman",
+        help=default("the Pacman policy: " + " or ".join(PACMAN_POLICIES)),
+        default="GreedyAgent",
+    )
+    parser.add_option(
+        "-g",
+        "--ghosts",
+        dest="ghost",
+        help=default("the ghost policy: " + " or ".join(GHOST_POLICIES)),
+        default="RandomGhost",
+    )
+    parser.add_option(
+        "-k",
+        "--numghosts",
+        type="int",
+        dest="numGhosts",
+        help=default("The maximum number of ghosts to use"),
+        default=4,
+    )
+    parser.add_option(
+        "-s",
+        "--seeds",
+        dest="seeds",
+        help=default('Seeds to play, one game each, e.g. "0-99" or "1,5,9"'),
+        default="0-99",
+    )
+    parser.add_option(
+        "-m",
+        "--maxMoves",
+        type="int",
+        dest="maxMoves",
+        help=default("Pacman moves after which a game is stopped, 0 for no limit"),
+        default=0,
+    )
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output",
+        help="File to write one JSON line per game to",
+        default=None,
+    )
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception("Command line input not understood: " + str(otherjunk))
+    return options
+
+
+if __name__ == "__main__":
+    import json
+    import time
+
+    from .batch import parseSeeds, summarize
+
+    options = readCommand(sys.argv[1:])
+    start = time.time()
+    games = runLockstep(
+        options.layout,
+        parseSeeds(options.seeds),
+        options.pacman,
+        options.ghost,
+        options.numGhosts,
+        options.maxMoves,
+    )
+    elapsed = time.time() - start
+    if options.output is not None:
+        with open(options.output, "w") as f:
+            for game in games:
+                f.write(json.dumps(game) + "\n")
+    print(summarize(games))
+    print("%d games in %.2f seconds" % (len(games), elapsed))
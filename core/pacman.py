@@ -34,12 +34,17 @@ from .game import GameStateData
 from .game import Game
 from .game import Directions
 from .game import Actions
+from .game import Configuration
+from .game import ZOBRIST
 from .util import nearestPoint
 from .util import manhattanDistance
 from . import layout
+import math
 import sys
 import random
 import os
+import importlib
+import itertools
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -65,19 +70,27 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable holding the active ExplorationRecorder, if any
+    recorder = None
 
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        """
+        Returns the states recorded by the active ExplorationRecorder (which
+        must keep states) and starts a fresh set.
+        """
+        recorder = GameState.recorder
+        if recorder is None or recorder.states is None:
+            return set()
+        tmp = recorder.states
+        recorder.states = set()
         return tmp
 
     getAndResetExplored = staticmethod(getAndResetExplored)
 
     def getLegalActions(self, agentIndex=0):
         """
-        Returns the legal actions for the agent specified.
+        Returns the legal actions for the agent specified.  The sequence may
+        be shared with other states, so copy it before changing it.
         """
         #        GameState.explored.add(self)
         if self.isWin() or self.isLose():
@@ -98,29 +111,83 @@ class GameState:
 
         # Copy current state
         state = GameState(self)
+        state._applyRules(agentIndex, action)
+        if GameState.recorder is not None:
+            GameState.recorder.record(self, state)
+        return state
+
+    def applyAction(self, agentIndex, action):
+        """
+        Makes the specified agent take the action in this state itself and
+        returns an UndoRecord that undoAction uses to take the move back.
+
+        This is the allocation-light alternative to generateSuccessor for
+        searches that walk the game tree one line at a time.  Every
+        applyAction must be undone, most recent first, before the state is
+        used for anything else.  Successors generated while an action is
+        applied are ordinary independent snapshots.
+        """
+        if self.isWin() or self.isLose():
+            raise Exception("Can't apply an action to a terminal state.")
+
+        undo = UndoRecord(self.data, agentIndex)
+        data = self.data
+        data._foodEaten = None
+        data._foodAdded = None
+        data._capsuleEaten = None
+        data.scoreChange = 0
+        self._applyRules(agentIndex, action)
+        return undo
+
+    def undoAction(self, undo):
+        """
+        Restores the state to what it was before the applyAction that
+        returned undo.
+        """
+        undo.restore(self.data)
 
+    def _applyRules(self, agentIndex, action):
+        """
+        Updates this state's data with the effects of the agent's action.
+        """
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
-            PacmanRules.applyAction(state, action)
+            self.data._eaten = [False for i in range(self.getNumAgents())]
+            PacmanRules.applyAction(self, action)
+            if action != Directions.STOP:
+                # The features of where Pacman was bound the new ones
+                self.data._featureHint = self.data._features
+                self.data._features = {}
         else:  # A ghost is moving
-            GhostRules.applyAction(state, action, agentIndex)
+            GhostRules.applyAction(self, action, agentIndex)
 
         # Time passes
         if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
+            self.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
         else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
+            GhostRules.decrementTimer(self.data.agentStates[agentIndex])
 
         # Resolve multi-agent effects
-        GhostRules.checkDeath(state, agentIndex)
+        GhostRules.checkDeath(self, agentIndex)
 
         # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
-        return state
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
+        if agentIndex == 0 and (
+            self.data._capsuleEaten is not None or True in self.data._eaten
+        ):
+            # Every ghost was scared, or an eaten one was sent home
+            self.data.refreshAgentKeys(range(self.getNumAgents()))
+        else:
+            self.data.refreshAgentKeys((agentIndex,))
+
+    def zobrist(self):
+        """
+        Returns a 64-bit Zobrist key for the state, maintained incrementally as
+        successors are generated.  Equal states have equal keys, so it can
+        stand in for the state in transposition tables and duplicate checks.
+        """
+        return self.data.zobrist()
 
     def getLegalPacmanActions(self):
         return self.getLegalActions(0)
@@ -172,7 +239,67 @@ class GameState:
         return self.data.capsules
 
     def getNumFood(self):
-        return self.data.food.count()
+        return self.data.numFood
+
+    def getFoodFeatures(self, distance=manhattanDistance):
+        """
+        Returns (closest food distance, closest capsule distance) from
+        Pacman, with None for distances to nothing left.
+
+        The features are kept with the state and carried over to successors
+        until Pacman moves, so the states of a ghost round share them.  After
+        a Pacman step the closest food is at least one step closer than it
+        was, so the search for it starts there.  distance must not change by
+        more than one per step, as manhattan and maze distances do.  For
+        those two (see Layout.getFoodIndex) the food is found through the
+        layout's FoodIndex in a few steps; other distances scan the food.
+        """
+        data = self.data
+        features = data._features.get(distance)
+        if features is not None:
+            return features
+
+        pos = data.agentStates[0].getPosition()
+        closestFood = None
+        if data.numFood > 0:
+            lowest = 0
+            if data._featureHint is not None:
+                hint = data._featureHint.get(distance)
+                # No reachable food before means no bound now
+                if hint is not None and hint[0] not in (None, math.inf):
+                    lowest = hint[0] - 1
+            index = data.layout.getFoodIndex(distance)
+            if index is not None:
+                closestFood = index.getClosestDistance(pos, data.food, lowest)
+            else:
+                for food in data.food.asList():
+                    foodDistance = distance(pos, food)
+                    if closestFood is None or foodDistance < closestFood:
+                        closestFood = foodDistance
+                        if closestFood <= lowest:
+                            break
+
+        closestCapsule = None
+        for capsule in data.capsules:
+            capsuleDistance = distance(pos, capsule)
+            if closestCapsule is None or capsuleDistance < closestCapsule:
+                closestCapsule = capsuleDistance
+
+        features = data._features[distance] = (closestFood, closestCapsule)
+        return features
+
+    def getNearestFood(self, count=1, distance=manhattanDistance):
+        """
+        Returns (distance, position) pairs of the count pellets nearest to
+        Pacman, nearest first.
+        """
+        pos = self.getPacmanPosition()
+        index = self.data.layout.getFoodIndex(distance)
+        if index is not None:
+            return index.getClosest(pos, self.data.food, count)
+        pellets = [(distance(pos, food), food) for food in self.data.food.asList()]
+        pellets.sort(key=lambda pellet: pellet[0])
+        return pellets[:count]
 
     def getFood(self):
         """
@@ -198,6 +325,21 @@ class GameState:
         """
         return self.data.layout.walls
 
+    def getMazeDistance(self, pos1, pos2):
+        """
+        Returns the length of the shortest path between two positions that
+        does not go through walls.  The distances of every maze are computed
+        once and cached (see layout.MazeDistances).
+        """
+        return self.data.layout.getMazeDistances().getDistance(pos1, pos2)
+
+    def getJunctionGraph(self):
+        """
+        Returns the maze compressed to its junctions and the corridors
+        between them (see layout.JunctionGraph).
+        """
+        return self.data.layout.getJunctionGraph()
+
     def hasFood(self, x, y):
         return self.data.food[x][y]
 
@@ -219,7 +361,7 @@ class GameState:
         """
         Generates a new state by copying information from its predecessor.
         """
-        if prevState != None:  # Initial state
+        if prevState is not None:  # Initial state
             self.data = GameStateData(prevState.data)
         else:
             self.data = GameStateData()
@@ -250,6 +392,187 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+    def packState(self):
+        """
+        Returns a compact, picklable tuple of everything that changes during a
+        game (the layout is not included), for shipping states to other
+        processes.  GameState.unpackState turns it back into a state.
+        """
+        data = self.data
+        agents = tuple(
+            (s.configuration.pos, s.configuration.direction, s.scaredTimer)
+            for s in data.agentStates
+        )
+        return (
+            data.food.bits,
+            tuple(data.capsules),
+            agents,
+            data.score,
+            tuple(data._eaten),
+            data._win,
+            data._lose,
+        )
+
+    def unpackState(packed, layout):
+        """
+        Rebuilds the state packed by packState on the given layout.
+        """
+        food, capsules, agents, score, eaten, win, lose = packed
+        state = GameState()
+        state.initialize(layout, len(agents) - 1)
+        data = state.data
+        data.food.bits = food
+        data.numFood = data.food.count()
+        data.capsules = list(capsules)
+        for agentState, (pos, direction, scaredTimer) in zip(data.agentStates, agents):
+            agentState.configuration = Configuration(pos, direction)
+            agentState.scaredTimer = scaredTimer
+        data.score = score
+        data._eaten = list(eaten)
+        data._win = win
+        data._lose = lose
+        data.resetZobrist()
+        return state
+
+    unpackState = staticmethod(unpackState)
+
+
+class ExplorationRecorder:
+    """
+    Keeps track of the successor states generated while it is active:
+
+      with ExplorationRecorder() as recorder:
+          agent.getAction(state)
+      print(recorder.numGenerated)
+
+    numExpanded counts the states that had at least one successor generated,
+    each once however often a search comes back to it.  A state is marked
+    with the recorder's id and its Zobrist key the first time, so a state
+    changed in place by applyAction counts again once it holds a different
+    position.
+
+    By default only counts are kept.  Pass keepStates=True to also collect
+    the distinct states expanded and generated (in recorder.states), which
+    keeps every one of them alive until the recorder is dropped.  Recorders
+    can be nested; the innermost one is active.  Moves made in place with
+    applyAction are not recorded.
+    """
+
+    # Ids that tell the marks of different recorders apart
+    nextId = itertools.count()
+
+    def __init__(self, keepStates=False):
+        self.numExpanded = 0
+        self.numGenerated = 0
+        self.states = set() if keepStates else None
+        self.id = next(ExplorationRecorder.nextId)
+        self.previous = None
+
+    def record(self, parent, successor):
+        self.numGenerated += 1
+        mark = (self.id, parent.data._zobrist)
+        if getattr(parent, "_expandedBy", None) != mark:
+            self.numExpanded += 1
+            parent._expandedBy = mark
+        if self.states is not None:
+            self.states.add(parent)
+            self.states.add(successor)
+
+    def __enter__(self):
+        self.previous = GameState.recorder
+        GameState.recorder = self
+        return self
+
+    def __exit__(self, *exc):
+        GameState.recorder = self.previous
+        self.previous = None
+        return False
+
+
+class UndoRecord:
+    """
+    Everything GameState.applyAction changes, so that undoAction can put it
+    back.
+
+    The rules never mutate the food grid, capsule list, eaten flags, agent
+    Zobrist keys or food features of a state in place (they install new
+    ones), so references to the old ones are enough.  A Pacman move can touch
+    every agent (capsules scare all ghosts, eating a ghost sends it home); a
+    ghost move only touches that ghost.
+    """
+
+    __slots__ = (
+        "agentIndex",
+        "agents",
+        "eaten",
+        "agentKeys",
+        "zobrist",
+        "features",
+        "featureHint",
+        "food",
+        "numFood",
+        "capsules",
+        "score",
+        "scoreChange",
+        "foodEaten",
+        "foodAdded",
+        "capsuleEaten",
+        "agentMoved",
+        "lose",
+        "win",
+    )
+
+    def __init__(self, data, agentIndex):
+        self.agentIndex = agentIndex
+        if agentIndex == 0:
+            self.agents = [(s.configuration, s.scaredTimer) for s in data.agentStates]
+        else:
+            ghostState = data.agentStates[agentIndex]
+            self.agents = [(ghostState.configuration, ghostState.scaredTimer)]
+        self.eaten = data._eaten
+        self.agentKeys = data._agentKeys
+        self.zobrist = data._zobrist
+        self.features = data._features
+        self.featureHint = data._featureHint
+        self.food = data.food
+        self.numFood = data.numFood
+        self.capsules = data.capsules
+        self.score = data.score
+        self.scoreChange = data.scoreChange
+        self.foodEaten = data._foodEaten
+        self.foodAdded = data._foodAdded
+        self.capsuleEaten = data._capsuleEaten
+        self.agentMoved = data._agentMoved
+        self.lose = data._lose
+        self.win = data._win
+
+    def restore(self, data):
+        if self.agentIndex == 0:
+            for agentState, (configuration, scaredTimer) in zip(
+                data.agentStates, self.agents
+            ):
+                agentState.configuration = configuration
+                agentState.scaredTimer = scaredTimer
+        else:
+            ghostState = data.agentStates[self.agentIndex]
+            ghostState.configuration, ghostState.scaredTimer = self.agents[0]
+        data._eaten = self.eaten
+        data._agentKeys = self.agentKeys
+        data._zobrist = self.zobrist
+        data._features = self.features
+        data._featureHint = self.featureHint
+        data.food = self.food
+        data.numFood = self.numFood
+        data.capsules = self.capsules
+        data.score = self.score
+        data.scoreChange = self.scoreChange
+        data._foodEaten = self.foodEaten
+        data._foodAdded = self.foodAdded
+        data._capsuleEaten = self.capsuleEaten
+        data._agentMoved = self.agentMoved
+        data._lose = self.lose
+        data._win = self.win
+
 
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
@@ -261,6 +584,10 @@ class GameState:
 SCARED_TIME = 40  # Moves ghosts are scared
 COLLISION_TOLERANCE = 0.7  # How close ghosts must be to Pacman to kill
 TIME_PENALTY = 1  # Number of points lost each round
+FOOD_SCORE = 10  # Points for eating a pellet
+GHOST_SCORE = 200  # Points for eating a scared ghost
+WIN_SCORE = 500  # Points for eating the last pellet
+LOSE_PENALTY = 500  # Points lost when a ghost catches Pacman
 
 
 class ClassicGameRules:
@@ -346,9 +673,12 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(
-            state.getPacmanState().configuration, state.data.layout.walls
-        )
+        conf = state.data.agentStates[0].configuration
+        layout = state.data.layout
+        actions = layout.pacmanActions.get(conf.pos)
+        if actions is None:
+            return Actions.getPossibleActions(conf, layout.walls)
+        return actions
 
     getLegalActions = staticmethod(getLegalActions)
 
@@ -379,19 +709,19 @@ class PacmanRules:
         x, y = position
         # Eat food
         if state.data.food[x][y]:
-            state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.scoreChange += FOOD_SCORE
+            state.data.food = state.data.food.without(x, y)
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
-                state.data.scoreChange += 500
+            state.data._zobrist ^= ZOBRIST.foodKey(position)
+            state.data.numFood -= 1
+            if state.data.numFood == 0 and not state.data._lose:
+                state.data.scoreChange += WIN_SCORE
                 state.data._win = True
         # Eat capsule
         if position in state.getCapsules():
-            state.data.capsules.remove(position)
+            state.data.capsules = [c for c in state.data.capsules if c != position]
             state.data._capsuleEaten = position
+            state.data._zobrist ^= ZOBRIST.capsuleKey(position)
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
                 state.data.agentStates[index].scaredTimer = SCARED_TIME
@@ -411,8 +741,14 @@ class GhostRules:
         Ghosts cannot stop, and cannot turn around unless they
         reach a dead end, but can turn 90 degrees at intersections.
         """
-        conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(conf, state.data.layout.walls)
+        conf = state.data.agentStates[ghostIndex].configuration
+        layout = state.data.layout
+        actions = layout.ghostActions.get((conf.pos, conf.direction))
+        if actions is not None:
+            return actions
+
+        # Scared ghosts between grid points
+        possibleActions = Actions.getPossibleActions(conf, layout.walls)
         reverse = Actions.reverseDirection(conf.direction)
         if Directions.STOP in possibleActions:
             possibleActions.remove(Directions.STOP)
@@ -439,7 +775,10 @@ class GhostRules:
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(ghostState.configuration.pos)
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration(
+                nearestPoint(configuration.pos), configuration.direction
+            )
         ghostState.scaredTimer = max(0, timer - 1)
 
     decrementTimer = staticmethod(decrementTimer)
@@ -462,14 +801,16 @@ class GhostRules:
 
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
-            state.data.scoreChange += 200
+            state.data.scoreChange += GHOST_SCORE
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
-            # Added for first-person
-            state.data._eaten[agentIndex] = True
+            # Added for first-person (copied, the list is shared with the parent)
+            eaten = state.data._eaten[:]
+            eaten[agentIndex] = True
+            state.data._eaten = eaten
         else:
             if not state.data._win:
-                state.data.scoreChange -= 500
+                state.data.scoreChange -= LOSE_PENALTY
                 state.data._lose = True
 
     collide = staticmethod(collide)
@@ -688,16 +1029,16 @@ def readCommand(argv):
 
     # Choose a display format
     if options.quietGraphics:
-        import textDisplay
+        from display import textDisplay
 
         args["display"] = textDisplay.NullGraphics()
     elif options.textGraphics:
-        import textDisplay
+        from display import textDisplay
 
         textDisplay.SLEEP_TIME = options.frameTime
         args["display"] = textDisplay.PacmanGraphics()
     else:
-        import graphicsDisplay
+        from display import graphicsDisplay
 
         args["display"] = graphicsDisplay.PacmanGraphics(
             options.zoom, frameTime=options.frameTime
@@ -724,6 +1065,10 @@ def readCommand(argv):
     return args
 
 
+# Packages (relative to the project root) searched for *Agents.py modules
+AGENT_PACKAGES = ["agents", "algorithms", "core"]
+
+
 def loadAgent(pacman, nographics):
     # Looks through all pythonPath Directories for the right module,
     pythonPathStr = os.path.expandvars("$PYTHONPATH")
@@ -732,14 +1077,20 @@ def loadAgent(pacman, nographics):
     else:
         pythonPathDirs = pythonPathStr.split(";")
     pythonPathDirs.append(".")
+    searchDirs = [(moduleDir, "") for moduleDir in pythonPathDirs]
+
+    # Then the agent modules that ship inside this project's packages
+    projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for package in AGENT_PACKAGES:
+        searchDirs.append((os.path.join(projectDir, package), package + "."))
 
-    for moduleDir in pythonPathDirs:
+    for moduleDir, prefix in searchDirs:
         if not os.path.isdir(moduleDir):
             continue
         moduleNames = [f for f in os.listdir(moduleDir) if f.endswith("gents.py")]
-        for modulename in moduleNames:
+        for modulename in sorted(moduleNames):
             try:
-                module = __import__(modulename[:-3])
+                module = importlib.import_module(prefix + modulename[:-3])
             except ImportError:
                 continue
             if pacman in dir(module):
@@ -752,8 +1103,8 @@ def loadAgent(pacman, nographics):
 
 
 def replayGame(layout, actions, display):
-    import pacmanAgents
-    import ghostAgents
+    from agents import pacmanAgents
+    from . import ghostAgents
 
     rules = ClassicGameRules()
     agents = [pacmanAgents.GreedyAgent()] + [
@@ -796,7 +1147,7 @@ def runGames(
         beQuiet = i < numTraining
         if beQuiet:
             # Suppress output and graphics
-            import textDisplay
+            from display import textDisplay
 
             gameDisplay = textDisplay.NullGraphics()
             rules.quiet = True
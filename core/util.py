@@ -1233,3 +1233,34 @@ def unmutePrint():
 
     sys.stdout = _ORIGINAL_STDOUT
     # sys.stderr = _ORIGINAL_STDERR
+
+
+# Persistent process pools shared by parallel searches and batch runs
+#
+import atexit
+import multiprocessing
+
+_PROCESS_POOLS = {}
+
+
+def getProcessPool(numWorkers):
+    """
+    Returns a multiprocessing pool with numWorkers processes.  The pool is
+    created on first use and then reused by every later caller, so the cost of
+    starting workers is paid once per process.  Pools are closed at exit.
+    """
+    pool = _PROCESS_POOLS.get(numWorkers)
+    if pool is None:
+        pool = multiprocessing.Pool(numWorkers)
+        _PROCESS_POOLS[numWorkers] = pool
+    return pool
+
+
+def closeProcessPools():
+    for pool in _PROCESS_POOLS.values():
+        pool.terminate()
+        pool.join()
+    _PROCESS_POOLS.clear()
+
+
+atexit.register(closeProcessPools)
@@ -489,12 +489,12 @@ class PacmanGraphics:
         refresh()
 
     def getPosition(self, agentState):
-        if agentState.configuration == None:
+        if agentState.configuration is None:
             return (-1000, -1000)
         return agentState.getPosition()
 
     def getDirection(self, agentState):
-        if agentState.configuration == None:
+        if agentState.configuration is None:
             return Directions.STOP
         return agentState.configuration.getDirection()
 
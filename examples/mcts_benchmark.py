@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+MCTS vs Alpha-Beta Benchmark
+============================
+
+Plays the same seeded games with MCTSAgent and with an anytime AlphaBetaAgent,
+giving both the same time per move, and prints the win rate and average
+score of each.
+
+Usage:
+    python mcts_benchmark.py [layout] [timeBudgetMs] [numGames] [workers]
+
+Defaults: mediumClassic, 100 ms per move, 20 games, 4 worker processes.
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.batch import BatchSpec, runBatch, summarize
+
+EVAL_FN = "betterEvaluationFunction"
+
+
+def get_specs(layout_name, time_budget_ms):
+    """Return the (name, BatchSpec) pairs of the agents to compare"""
+    budget = str(time_budget_ms)
+    return [
+        (
+            "MCTSAgent",
+            BatchSpec(
+                layout_name,
+                "MCTSAgent",
+                {"evalFn": EVAL_FN, "timeBudgetMs": budget},
+                ghost="DirectionalGhost",
+            ),
+        ),
+        (
+            "AlphaBetaAgent",
+            BatchSpec(
+                layout_name,
+                "AlphaBetaAgent",
+                {"evalFn": EVAL_FN, "timeBudgetMs": budget},
+                ghost="DirectionalGhost",
+            ),
+        ),
+    ]
+
+
+def main():
+    """Main benchmark function"""
+    args = sys.argv[1:]
+    layout_name = args[0] if len(args) > 0 else "mediumClassic"
+    time_budget_ms = int(args[1]) if len(args) > 1 else 100
+    num_games = int(args[2]) if len(args) > 2 else 20
+    workers = int(args[3]) if len(args) > 3 else 4
+
+    print(
+        f"{num_games} games per agent on {layout_name}, "
+        f"{time_budget_ms} ms per move, {workers} workers"
+    )
+    print("=" * 50)
+
+    for name, spec in get_specs(layout_name, time_budget_ms):
+        games = runBatch(spec, range(num_games), workers)
+        moves = sum(game["moves"] for game in games)
+        thinking = sum(game["agentTimes"][0] for game in games)
+        print(f"{name:16} {summarize(games)}")
+        print(f"{'':16} {1000 * thinking / max(moves, 1):.1f} ms per move")
+
+
+if __name__ == "__main__":
+    main()